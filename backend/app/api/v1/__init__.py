@@ -1,7 +1,9 @@
 # backend/app/api/v1/__init__.py
 from fastapi import APIRouter
-from .endpoints import documents, reports
+from .endpoints import aggregates, companies, documents, reports
 
 api_router = APIRouter()
 api_router.include_router(documents.router, prefix="/documents", tags=["documents"])
-api_router.include_router(reports.router, prefix="/reports", tags=["reports"]) 
\ No newline at end of file
+api_router.include_router(reports.router, prefix="/reports", tags=["reports"])
+api_router.include_router(companies.router, prefix="/companies", tags=["companies"]) 
+api_router.include_router(aggregates.router, prefix="/aggregates", tags=["aggregates"])
\ No newline at end of file
@@ -0,0 +1,40 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Path, Query
+from app.services import aggregation_service
+
+router = APIRouter()
+
+@router.get(
+    "/{doc_type}/{year}",
+    summary="Obtém as distribuições de indicadores por setor e do mercado para um período",
+    response_description="Distribuições em \"aggregates\": {\"mercado\" | setor: {indicador: distribuição}}"
+)
+def get_period_aggregates(
+    doc_type: str = Path(..., title="Tipo de Documento", description="ITR ou FRE", pattern="^(ITR|FRE|itr|fre)$"),
+    year: int = Path(..., title="Ano do documento", ge=2010),
+    sector: Optional[str] = Query(None, title="Setor", description="Setor de atividade (SETOR_ATIV do cadastro da CVM). Se omitido, retorna todos.")
+):
+    """
+    Retorna, para cada indicador, a contagem, média, mínimo, máximo, mediana e quantis
+    (p10, p25, p75, p90) entre as empresas do período, por setor e para o mercado todo.
+    `sector_available` é falso quando não há agregados por setor (cadastro da CVM indisponível).
+    """
+    doc_type_upper = doc_type.upper()
+    if not aggregation_service.ensure_period_aggregated(doc_type_upper, year):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Agregados indisponíveis para {doc_type_upper} de {year}. Se o período ainda não foi processado, ele está sendo gravado em segundo plano; tente novamente em alguns minutos."
+        )
+
+    aggregates = aggregation_service.get_period_aggregates(doc_type_upper, year, sector)
+    if not aggregates:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nenhum agregado encontrado para {doc_type_upper} de {year}" + (f" no setor {sector}." if sector else ".")
+        )
+    return {
+        "doc_type": doc_type_upper,
+        "year": year,
+        "sector_available": any(scope != "mercado" for scope in aggregates),
+        "aggregates": aggregates,
+    }
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, HTTPException, Path, Query
+from app.services import aggregation_service, company_service
+
+router = APIRouter()
+
+@router.get(
+    "/search",
+    summary="Busca empresas por nome, ticker ou CNPJ (autocomplete)",
+    response_description="Lista de empresas com CNPJ formatado e os anos disponíveis por tipo de documento"
+)
+def search_companies(
+    q: str = Query(..., min_length=2, title="Termo de busca", description="Início do nome (sem acentos), do ticker ou do CNPJ"),
+    limit: int = Query(10, ge=1, le=50, title="Número máximo de resultados")
+):
+    """
+    Busca no diretório de empresas construído durante a ingestão dos arquivos da CVM.
+
+    - **q**: ex: "petro", "vale", "PETR4" ou "33.000.167".
+    - **limit**: número máximo de resultados.
+    """
+    return company_service.search_companies(q, limit)
+
+@router.get(
+    "/{cnpj:path}/peers/{doc_type}/{year}",
+    summary="Obtém o contexto de pares de uma empresa (percentis e distribuições do setor e do mercado)",
+    response_description="Indicadores da empresa com percentis e as distribuições de mercado e setor"
+)
+def get_company_peers(
+    cnpj: str = Path(..., title="CNPJ da Empresa", description="CNPJ formatado: XX.XXX.XXX/XXXX-XX", pattern=r"^\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}$"),
+    doc_type: str = Path(..., title="Tipo de Documento", description="ITR ou FRE", pattern="^(ITR|FRE|itr|fre)$"),
+    year: int = Path(..., title="Ano do documento", ge=2010)
+):
+    """
+    Retorna os indicadores da empresa no período (margens, ROE, endividamento, etc.), sua
+    posição percentual entre os pares e as distribuições pré-calculadas do setor e do mercado.
+    """
+    doc_type_upper = doc_type.upper()
+    if not aggregation_service.ensure_period_aggregated(doc_type_upper, year):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Agregados indisponíveis para {doc_type_upper} de {year}. Se o período ainda não foi processado, ele está sendo gravado em segundo plano; tente novamente em alguns minutos."
+        )
+
+    peer_context = aggregation_service.get_peer_context(cnpj, doc_type_upper, year)
+    if not peer_context:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Nenhum indicador encontrado para o CNPJ {cnpj} para {doc_type_upper} de {year}."
+        )
+    return peer_context
+
+@router.get(
+    "/{cnpj:path}",
+    summary="Obtém os dados de uma empresa do diretório",
+    response_description="Dados cadastrais da empresa e os anos disponíveis por tipo de documento"
+)
+def get_company(
+    cnpj: str = Path(..., title="CNPJ da Empresa", description="CNPJ formatado (XX.XXX.XXX/XXXX-XX) ou apenas os 14 dígitos", pattern=r"^(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}|\d{14})$")
+):
+    """
+    Retorna uma empresa do diretório a partir do seu CNPJ.
+    """
+    company = company_service.get_company(cnpj)
+    if not company:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Empresa com CNPJ {cnpj} não encontrada no diretório."
+        )
+    return company
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Path, Query
 from typing import List
+import pandas as pd
 from app.services import cvm_service
 
 router = APIRouter()
@@ -77,7 +78,11 @@ def get_company_statements(
         )
 
     # Converte os dataframes para JSON. O formato 'records' cria uma lista de objetos.
-    json_output = {key: df.to_dict(orient='records') for key, df in result_dfs.items()}
+    # NaN não é um valor JSON válido: células vazias viram null.
+    json_output = {
+        key: df.astype(object).where(pd.notna(df), None).to_dict(orient='records')
+        for key, df in result_dfs.items()
+    }
     
     return json_output
 
@@ -1,6 +1,12 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from app.services import cvm_service, ai_service
+from sqlalchemy.orm import Session
+from app import crud, models
+from app.core.database import SessionLocal, get_db
+from app.services import aggregation_service, cvm_service, ai_service
 
 router = APIRouter()
 
@@ -9,17 +15,19 @@ class ReportRequest(BaseModel):
     year: int = Field(..., description="Ano do relatório", ge=2010)
     doc_type: str = Field(..., description="Tipo de documento (ITR ou FRE)", pattern="^(ITR|FRE|itr|fre)$")
 
-@router.post(
-    "/generate",
-    summary="Gera um relatório de análise fundamentalista e dados financeiros estruturados",
-    response_description="Um JSON com a análise textual e um resumo financeiro"
-)
-def generate_report(request: ReportRequest):
-    """
-    Gera uma análise fundamentalista completa para uma empresa, utilizando os dados
-    da CVM e um modelo de linguagem avançado.
-    """
-    # 1. Obter os dados financeiros usando o cvm_service
+def _report_response(db_report: models.ReportDB, cached: bool = False) -> dict:
+    return {
+        "report_id": db_report.id,
+        "company_cnpj": db_report.cnpj,
+        "doc_type": db_report.doc_type,
+        "year": db_report.year,
+        "report": db_report.report,
+        "financial_summary": db_report.financial_summary,
+        "created_at": db_report.created_at,
+        "cached": cached,
+    }
+
+def _get_financial_data_or_404(request: ReportRequest):
     financial_data = cvm_service.get_financial_statements(
         doc_type=request.doc_type.upper(),
         year=request.year,
@@ -31,9 +39,41 @@ def generate_report(request: ReportRequest):
             status_code=404,
             detail=f"Não foi possível encontrar dados financeiros para o CNPJ {request.cnpj} para {request.doc_type.upper()} de {request.year}."
         )
+    return financial_data
+
+def _get_peer_context(request: ReportRequest):
+    # O contexto de pares é opcional: sem agregados, o relatório é gerado só com os dados da empresa
+    doc_type = request.doc_type.upper()
+    if not aggregation_service.ensure_period_aggregated(doc_type, request.year):
+        return None
+    return aggregation_service.get_peer_context(request.cnpj, doc_type, request.year)
 
-    # 2. Gerar a análise e os dados estruturados usando o ai_service
-    analysis_data = ai_service.generate_financial_analysis(financial_data)
+@router.post(
+    "/generate",
+    summary="Gera um relatório de análise fundamentalista e dados financeiros estruturados",
+    response_description="Um JSON com a análise textual e um resumo financeiro"
+)
+def generate_report(request: ReportRequest):
+    """
+    Gera uma análise fundamentalista completa para uma empresa, utilizando os dados
+    da CVM e um modelo de linguagem avançado. Se um relatório já foi gerado para os
+    mesmos dados de entrada, ele é retornado sem chamar a IA novamente.
+    """
+    # As sessões do banco são abertas só para a leitura e a gravação: manter uma conexão
+    # do pool durante a chamada à IA (dezenas de segundos) esgotaria o pool sob concorrência.
+    # 1. Obter os dados financeiros usando o cvm_service
+    financial_data = _get_financial_data_or_404(request)
+
+    # 2. Reaproveitar um relatório já gerado para os mesmos dados
+    peer_context = _get_peer_context(request)
+    input_hash = ai_service.compute_input_hash(ai_service.prepare_financial_data(financial_data), peer_context)
+    with SessionLocal() as db:
+        db_report = crud.get_report_by_hash(db, input_hash)
+        if db_report:
+            return _report_response(db_report, cached=True)
+
+    # 3. Gerar a análise e os dados estruturados usando o ai_service
+    analysis_data = ai_service.generate_financial_analysis(financial_data, peer_context)
 
     if not analysis_data or "report" not in analysis_data or "financial_summary" not in analysis_data:
         raise HTTPException(
@@ -41,14 +81,134 @@ def generate_report(request: ReportRequest):
             detail="Ocorreu um erro no serviço de IA ao tentar gerar a análise."
         )
 
-    return {
-        "company_cnpj": request.cnpj,
-        "year": request.year,
-        "report": analysis_data["report"],
-        "financial_summary": analysis_data["financial_summary"]
-    }
+    # O resumo é validado antes de ser gravado: o stream serve relatórios gravados como já validados
+    financial_summary = ai_service.validate_financial_summary(analysis_data["financial_summary"])
+    if financial_summary is None:
+        raise HTTPException(
+            status_code=500,
+            detail="O resumo financeiro retornado pelo serviço de IA é inválido."
+        )
+
+    # 4. Persistir o relatório para consultas futuras
+    with SessionLocal() as db:
+        db_report = crud.create_report(
+            db,
+            cnpj=request.cnpj,
+            doc_type=request.doc_type.upper(),
+            year=request.year,
+            input_hash=input_hash,
+            report=analysis_data["report"],
+            financial_summary=financial_summary,
+            model_name=ai_service.GEMINI_MODEL_NAME
+        )
+        return _report_response(db_report)
+
+def _format_sse(event: str, data) -> str:
+    """Formata um evento no padrão Server-Sent Events, com os dados serializados em JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post(
+    "/generate/stream",
+    summary="Gera o relatório de análise fundamentalista em streaming (Server-Sent Events)",
+    response_description="Eventos SSE: financial_data, report_chunk, financial_summary, error e done"
+)
+def generate_report_stream(request: ReportRequest):
+    """
+    Variante em streaming de `/generate`. Os dados financeiros e o contexto de pares são
+    enviados imediatamente (evento `financial_data`), o texto do relatório é enviado em partes
+    à medida que o modelo o produz (eventos `report_chunk`) e o resumo financeiro validado é
+    enviado ao final (evento `financial_summary`). O evento `done` encerra o stream e informa o `report_id`.
+    """
+    # A busca dos dados acontece antes do stream, para que a ausência de dados ainda resulte em 404
+    financial_data = _get_financial_data_or_404(request)
+    financial_data_json = ai_service.prepare_financial_data(financial_data)
+    peer_context = _get_peer_context(request)
+    input_hash = ai_service.compute_input_hash(financial_data_json, peer_context)
+
+    def event_stream():
+        yield _format_sse("financial_data", {
+            "company_cnpj": request.cnpj,
+            "year": request.year,
+            "financial_data": financial_data_json,
+            "peer_context": peer_context
+        })
+
+        # As sessões são abertas aqui (o stream continua após o fim do processamento da
+        # requisição) e fechadas antes do streaming da IA, para não prender uma conexão do pool
+        with SessionLocal() as db:
+            db_report = crud.get_report_by_hash(db, input_hash)
+            cached = None
+            if db_report:
+                cached = (db_report.report, db_report.financial_summary, db_report.id)
+        if cached:
+            report, financial_summary, report_id = cached
+            yield _format_sse("report_chunk", report)
+            yield _format_sse("financial_summary", financial_summary)
+            yield _format_sse("done", {"report_id": report_id, "cached": True})
+            return
+
+        report_chunks = []
+        financial_summary = None
+        for event, data in ai_service.stream_financial_analysis(financial_data_json, peer_context):
+            if event == "report_chunk":
+                report_chunks.append(data)
+            elif event == "financial_summary":
+                financial_summary = data
+            yield _format_sse(event, data)
 
-# @router.get("/{report_id}")
-# async def get_generated_report(report_id: str):
-#     # Lógica para obter um relatório gerado
-#     return {"report_id": report_id, "content": "..."} 
\ No newline at end of file
+        report_id = None
+        if financial_summary is not None:
+            with SessionLocal() as db:
+                report_id = crud.create_report(
+                    db,
+                    cnpj=request.cnpj,
+                    doc_type=request.doc_type.upper(),
+                    year=request.year,
+                    input_hash=input_hash,
+                    report="".join(report_chunks),
+                    financial_summary=financial_summary,
+                    model_name=ai_service.GEMINI_MODEL_NAME
+                ).id
+        yield _format_sse("done", {"report_id": report_id, "cached": False})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Evita que proxies acumulem a resposta antes de repassá-la ao cliente
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get(
+    "/",
+    summary="Lista os relatórios já gerados",
+    response_description="Lista de relatórios, do mais recente para o mais antigo"
+)
+def list_reports(
+    cnpj: Optional[str] = Query(None, description="CNPJ formatado: XX.XXX.XXX/XXXX-XX", pattern=r"^\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}$"),
+    doc_type: Optional[str] = Query(None, description="ITR ou FRE", pattern="^(ITR|FRE|itr|fre)$"),
+    year: Optional[int] = Query(None, ge=2010),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    """
+    Lista os relatórios gravados, com filtros opcionais por empresa e período.
+    """
+    db_reports = crud.list_reports(db, cnpj=cnpj, doc_type=doc_type.upper() if doc_type else None, year=year, limit=limit)
+    return [_report_response(db_report, cached=True) for db_report in db_reports]
+
+@router.get(
+    "/{report_id}",
+    summary="Obtém um relatório já gerado",
+    response_description="O relatório gravado, com a análise textual e o resumo financeiro"
+)
+def get_generated_report(report_id: int = Path(..., title="ID do relatório", ge=1), db: Session = Depends(get_db)):
+    """
+    Retorna um relatório gravado anteriormente, sem recalculá-lo.
+    """
+    db_report = crud.get_report(db, report_id)
+    if not db_report:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Relatório {report_id} não encontrado."
+        )
+    return _report_response(db_report, cached=True)
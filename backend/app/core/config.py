@@ -11,6 +11,7 @@
 
 from pydantic_settings import BaseSettings
 from pydantic import HttpUrl
+from typing import List
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Análise Fundamentalista com IA API"
@@ -25,6 +26,40 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     CVM_API_BASE_URL: HttpUrl = "https://dados.cvm.gov.br/dados/"
 
+    # Cache em memória dos dados da CVM
+    # Tempo (em segundos) que a listagem de arquivos .zip da CVM fica em cache
+    CVM_LISTING_CACHE_TTL_SECONDS: int = 3600
+    # Número máximo de tabelas (doc_type/ano/demonstração) mantidas em memória. Cada tabela
+    # de um ano de ITR pode ocupar centenas de MB; o padrão equivale a um período.
+    # Com o banco ativo (STATEMENT_STORE_ENABLED), esse cache só é usado como alternativa.
+    STATEMENTS_CACHE_MAX_TABLES: int = 4
+
+    # Aquecimento do cache na inicialização e pré-carregamento agendado
+    WARMUP_ENABLED: bool = True
+    # Períodos a pré-carregar no formato "TIPO:ANO" (ex: ["ITR:2024", "ITR:2023"])
+    WARMUP_TARGETS: List[str] = []
+    # Quantos períodos mais acessados (frequência observada) também pré-carregar
+    WARMUP_TOP_PERIODS: int = 2
+    # Intervalo (em segundos) entre execuções do pré-carregamento agendado. 0 desativa o agendador.
+    WARMUP_INTERVAL_SECONDS: int = 6 * 3600
+    # Arquivo onde as estatísticas de acesso são persistidas entre reinicializações
+    ACCESS_STATS_PATH: str = "data/access_stats.json"
+    # Intervalo (em segundos) entre gravações das estatísticas de acesso
+    ACCESS_STATS_SAVE_INTERVAL_SECONDS: int = 300
+
+    # Banco de dados embarcado (arquivo local) com as demonstrações e os relatórios gerados
+    DATABASE_URL: str = "sqlite:///data/analise_fundamentalista.db"
+    # Tempo máximo (em segundos) que uma escrita espera o banco ser liberado por outra
+    DATABASE_BUSY_TIMEOUT_SECONDS: int = 30
+    # Se True, os períodos baixados são gravados no banco e as consultas usam seus índices
+    STATEMENT_STORE_ENABLED: bool = True
+
+    # Diretório de empresas (busca por nome/ticker/CNPJ)
+    COMPANY_INDEX_PATH: str = "data/company_index.json"
+    # Se True, baixa o cadastro de companhias abertas e o FCA (tickers) da CVM para enriquecer
+    # o diretório, na inicialização e a cada ciclo do pré-carregamento
+    COMPANY_CADASTRO_ENABLED: bool = True
+
     class Config:
         # O Pydantic irá procurar por um arquivo .env e carregar as variáveis dele
         env_file = ".env"
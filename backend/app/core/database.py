@@ -0,0 +1,47 @@
+# Configuração do banco de dados embarcado (SQLite), usado para armazenar as demonstrações
+# normalizadas e os relatórios gerados.
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import declarative_base, sessionmaker
+from app.core.config import settings
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    # A mesma conexão pode ser usada pelas threads do FastAPI e pelo pré-carregamento.
+    # O timeout faz uma escrita esperar o lote em andamento em vez de falhar com "database is locked".
+    connect_args={
+        "check_same_thread": False,
+        "timeout": settings.DATABASE_BUSY_TIMEOUT_SECONDS,
+    } if settings.DATABASE_URL.startswith("sqlite") else {},
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not settings.DATABASE_URL.startswith("sqlite"):
+        return
+    cursor = dbapi_connection.cursor()
+    # WAL permite leituras concorrentes enquanto um período é gravado
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+Base = declarative_base()
+
+def init_db() -> None:
+    """Cria o diretório do arquivo do banco (SQLite) e as tabelas que ainda não existem."""
+    # Importa os modelos para que sejam registrados no Base.metadata
+    from app import models  # noqa: F401
+
+    if engine.url.get_backend_name() == "sqlite" and engine.url.database:
+        os.makedirs(os.path.dirname(engine.url.database) or ".", exist_ok=True)
+    Base.metadata.create_all(bind=engine)
+
+def get_db():
+    """Dependência do FastAPI que fornece uma sessão do banco por requisição."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,14 +1,266 @@
 # Funções para interagir com o banco de dados (CRUD operations).
-# Exemplo com SQLAlchemy:
-# from sqlalchemy.orm import Session
-# from .. import models, schemas
-
-# def get_document(db: Session, document_id: int):
-#     return db.query(models.DocumentDB).filter(models.DocumentDB.id == document_id).first()
-
-# def create_document(db: Session, document: schemas.DocumentCreate):
-#     db_document = models.DocumentDB(**document.dict()) # ou model_dump() para Pydantic v2
-#     db.add(db_document)
-#     db.commit()
-#     db.refresh(db_document)
-#     return db_document 
\ No newline at end of file
+from typing import Any, Dict, List, Tuple
+import pandas as pd
+from sqlalchemy import and_, delete, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import models
+
+# Mapeamento das colunas dos CSVs da CVM (na ordem dos arquivos) para as colunas da tabela statement_rows
+STATEMENT_COLUMNS = {
+    "CNPJ_CIA": "cnpj",
+    "DT_REFER": "dt_refer",
+    "VERSAO": "versao",
+    "DENOM_CIA": "denom_cia",
+    "CD_CVM": "cd_cvm",
+    "GRUPO_DFP": "grupo_dfp",
+    "MOEDA": "moeda",
+    "ESCALA_MOEDA": "escala_moeda",
+    "ORDEM_EXERC": "ordem_exerc",
+    "DT_INI_EXERC": "dt_ini_exerc",
+    "DT_FIM_EXERC": "dt_fim_exerc",
+    "CD_CONTA": "cd_conta",
+    "DS_CONTA": "ds_conta",
+    "VL_CONTA": "vl_conta",
+    "ST_CONTA_FIXA": "st_conta_fixa",
+}
+
+# Cada lote é gravado em uma transação curta, para não bloquear outras escritas
+# (ex: gravação de relatórios) durante a ingestão de um período inteiro
+INSERT_BATCH_SIZE = 20_000
+
+# --- Demonstrações ---
+
+def is_period_stored(db: Session, doc_type: str, year: int) -> bool:
+    return db.get(models.IngestedPeriodDB, (doc_type, year)) is not None
+
+def list_stored_periods(db: Session) -> List[models.IngestedPeriodDB]:
+    return db.scalars(select(models.IngestedPeriodDB).order_by(
+        models.IngestedPeriodDB.doc_type, models.IngestedPeriodDB.year
+    )).all()
+
+def replace_period_statements(
+    db: Session,
+    doc_type: str,
+    year: int,
+    statement_dfs: Dict[str, pd.DataFrame],
+    batch_size: int = INSERT_BATCH_SIZE
+) -> int:
+    """
+    Substitui todas as linhas de um período pelas dos DataFrames informados.
+
+    A gravação é feita em lotes, cada um em sua própria transação. O período só é marcado
+    como gravado (ingested_periods) ao final, então consultas concorrentes nunca o
+    consideram disponível pela metade.
+
+    Args:
+        statement_dfs: Dicionário demonstração (ex: "BPA") -> DataFrame completo lido do CSV da CVM.
+
+    Returns:
+        O número de linhas gravadas.
+    """
+    row = models.StatementRowDB
+    period_filter = (row.doc_type == doc_type, row.year == year)
+
+    db.execute(delete(models.IngestedPeriodDB).where(
+        models.IngestedPeriodDB.doc_type == doc_type,
+        models.IngestedPeriodDB.year == year,
+    ))
+    db.commit()
+    for statement in db.scalars(select(row.statement).where(*period_filter).distinct()).all():
+        db.execute(delete(row).where(*period_filter, row.statement == statement))
+        db.commit()
+
+    row_count = 0
+    statement_columns = {}
+    for statement, df in statement_dfs.items():
+        unknown = [col for col in df.columns if col not in STATEMENT_COLUMNS]
+        if unknown:
+            print(f"Aviso: Colunas desconhecidas em {statement} de {doc_type}/{year} não serão gravadas: {unknown}")
+        columns = [col for col in df.columns if col in STATEMENT_COLUMNS]
+        statement_columns[statement] = columns
+
+        for start in range(0, len(df), batch_size):
+            batch = df.iloc[start:start + batch_size][columns].rename(columns=STATEMENT_COLUMNS)
+            # NaN não é aceito pelo driver: converte para None
+            batch = batch.astype(object).where(pd.notna(batch), None)
+            batch["doc_type"] = doc_type
+            batch["year"] = year
+            batch["statement"] = statement
+            db.execute(insert(row), batch.to_dict(orient="records"))
+            db.commit()
+        row_count += len(df)
+
+    db.merge(models.IngestedPeriodDB(doc_type=doc_type, year=year, row_count=row_count, columns=statement_columns))
+    db.commit()
+    return row_count
+
+def get_company_statements(
+    db: Session,
+    cnpj: str,
+    doc_type: str,
+    year: int,
+    statements: List[str] = None
+) -> Dict[str, pd.DataFrame]:
+    """
+    Busca as demonstrações de uma empresa/período usando o índice (cnpj, doc_type, year, statement).
+
+    Returns:
+        Dicionário demonstração -> DataFrame com as mesmas colunas (e na mesma ordem de linhas)
+        do CSV da CVM daquela demonstração.
+    """
+    period = db.get(models.IngestedPeriodDB, (doc_type, year))
+    if period is None:
+        return {}
+
+    row = models.StatementRowDB
+    db_columns = [getattr(row, col) for col in STATEMENT_COLUMNS.values()]
+    query = select(row.statement, *db_columns).where(
+        row.cnpj == cnpj,
+        row.doc_type == doc_type,
+        row.year == year,
+    )
+    if statements is not None:
+        query = query.where(row.statement.in_(statements))
+
+    # A ordem de inserção (id) é a ordem das linhas no CSV
+    result = db.execute(query.order_by(row.statement, row.id))
+    df = pd.DataFrame(result.all(), columns=["statement", *STATEMENT_COLUMNS.keys()])
+    csv_columns = period.columns or {}
+    return {
+        statement: group[csv_columns.get(statement, list(STATEMENT_COLUMNS))].reset_index(drop=True)
+        for statement, group in df.groupby("statement", sort=False)
+    }
+
+def get_period_account_rows(db: Session, doc_type: str, year: int, accounts: List[Tuple[str, str]]) -> pd.DataFrame:
+    """
+    Busca, para todas as empresas de um período, as linhas das contas informadas
+    (pares demonstração/código da conta, ex: ("DRE", "3.01")).
+    """
+    row = models.StatementRowDB
+    query = select(
+        row.cnpj, row.statement, row.cd_conta, row.ds_conta, row.vl_conta, row.escala_moeda,
+        row.versao, row.ordem_exerc, row.dt_refer, row.dt_ini_exerc, row.dt_fim_exerc,
+    ).where(
+        row.doc_type == doc_type,
+        row.year == year,
+        or_(*[and_(row.statement == statement, row.cd_conta == cd_conta) for statement, cd_conta in accounts]),
+    )
+    result = db.execute(query)
+    return pd.DataFrame(result.all(), columns=list(result.keys()))
+
+# --- Agregados por setor e mercado ---
+
+def is_period_aggregated(db: Session, doc_type: str, year: int) -> bool:
+    query = select(models.PeerAggregateDB.metric).where(
+        models.PeerAggregateDB.doc_type == doc_type,
+        models.PeerAggregateDB.year == year,
+    ).limit(1)
+    return db.execute(query).first() is not None
+
+def list_aggregated_periods(db: Session) -> List[Tuple[str, int]]:
+    query = select(models.PeerAggregateDB.doc_type, models.PeerAggregateDB.year).distinct().order_by(
+        models.PeerAggregateDB.doc_type, models.PeerAggregateDB.year
+    )
+    return [tuple(row) for row in db.execute(query).all()]
+
+def get_period_company_sectors(db: Session, doc_type: str, year: int) -> Dict[str, str | None]:
+    """Retorna o setor usado no cálculo dos indicadores de cada empresa do período."""
+    query = select(models.CompanyMetricDB.cnpj, models.CompanyMetricDB.sector).distinct().where(
+        models.CompanyMetricDB.doc_type == doc_type,
+        models.CompanyMetricDB.year == year,
+    )
+    return dict(db.execute(query).all())
+
+def replace_period_aggregates(
+    db: Session,
+    doc_type: str,
+    year: int,
+    company_metrics: List[Dict[str, Any]],
+    aggregates: List[Dict[str, Any]]
+) -> None:
+    """Substitui, em uma única transação, os indicadores e agregados de um período."""
+    for model in (models.CompanyMetricDB, models.PeerAggregateDB):
+        db.execute(delete(model).where(model.doc_type == doc_type, model.year == year))
+    if company_metrics:
+        db.execute(insert(models.CompanyMetricDB), company_metrics)
+    if aggregates:
+        db.execute(insert(models.PeerAggregateDB), aggregates)
+    db.commit()
+
+def get_period_aggregates(db: Session, doc_type: str, year: int, sector: str = None) -> List[models.PeerAggregateDB]:
+    query = select(models.PeerAggregateDB).where(
+        models.PeerAggregateDB.doc_type == doc_type,
+        models.PeerAggregateDB.year == year,
+    )
+    if sector is not None:
+        query = query.where(models.PeerAggregateDB.sector == sector)
+    return db.scalars(query.order_by(models.PeerAggregateDB.sector, models.PeerAggregateDB.metric)).all()
+
+def get_company_peer_context(
+    db: Session, cnpj: str, doc_type: str, year: int, market_sector: str
+) -> List[Tuple[models.CompanyMetricDB, models.PeerAggregateDB]]:
+    """
+    Busca, em uma única consulta, os indicadores da empresa no período junto com os
+    agregados do mercado (sector = market_sector) e do setor da empresa.
+    """
+    metric = models.CompanyMetricDB
+    aggregate = models.PeerAggregateDB
+    query = select(metric, aggregate).join(aggregate, and_(
+        aggregate.doc_type == metric.doc_type,
+        aggregate.year == metric.year,
+        aggregate.metric == metric.metric,
+        or_(aggregate.sector == market_sector, aggregate.sector == metric.sector),
+    )).where(
+        metric.cnpj == cnpj,
+        metric.doc_type == doc_type,
+        metric.year == year,
+    )
+    return db.execute(query).all()
+
+# --- Relatórios ---
+
+def get_report(db: Session, report_id: int) -> models.ReportDB | None:
+    return db.get(models.ReportDB, report_id)
+
+def get_report_by_hash(db: Session, input_hash: str) -> models.ReportDB | None:
+    return db.scalars(select(models.ReportDB).where(models.ReportDB.input_hash == input_hash)).first()
+
+def list_reports(db: Session, cnpj: str = None, doc_type: str = None, year: int = None, limit: int = 50) -> List[models.ReportDB]:
+    query = select(models.ReportDB)
+    if cnpj:
+        query = query.where(models.ReportDB.cnpj == cnpj)
+    if doc_type:
+        query = query.where(models.ReportDB.doc_type == doc_type)
+    if year:
+        query = query.where(models.ReportDB.year == year)
+    return db.scalars(query.order_by(models.ReportDB.created_at.desc()).limit(limit)).all()
+
+def create_report(
+    db: Session,
+    cnpj: str,
+    doc_type: str,
+    year: int,
+    input_hash: str,
+    report: str,
+    financial_summary: Dict[str, Any],
+    model_name: str = None
+) -> models.ReportDB:
+    db_report = models.ReportDB(
+        cnpj=cnpj,
+        doc_type=doc_type,
+        year=year,
+        input_hash=input_hash,
+        report=report,
+        financial_summary=financial_summary,
+        model_name=model_name,
+    )
+    db.add(db_report)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Outra requisição gravou o mesmo relatório (mesmo input_hash) ao mesmo tempo
+        db.rollback()
+        return get_report_by_hash(db, input_hash)
+    db.refresh(db_report)
+    return db_report
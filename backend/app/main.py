@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from app.api.v1 import api_router
 from app.core.config import settings
+from app.core.database import init_db
+from app.services import company_service, warmup_service
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(
@@ -21,6 +23,19 @@ app.add_middleware(
     allow_headers=["*"],  # Permite todos os cabeçalhos
 )
 
+@app.on_event("startup")
+def on_startup():
+    # Cria o arquivo do banco e as tabelas, se ainda não existirem
+    init_db()
+    # Carrega o diretório de empresas (ou o reconstrói em segundo plano, se ainda não existir)
+    company_service.start()
+    # Roda em segundo plano: a API fica pronta imediatamente enquanto o cache é aquecido
+    warmup_service.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    warmup_service.stop()
+
 @app.get("/")
 def read_root():
     return {"message": "Bem-vindo à API de Análise Fundamentalista com IA!"}
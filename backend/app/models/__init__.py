@@ -1,11 +1,99 @@
-# Aqui ficariam os modelos de dados, por exemplo, usando SQLAlchemy
-# from sqlalchemy import Column, Integer, String, ForeignKey
-# from sqlalchemy.orm import relationship
-# from ..core.database import Base # Supondo que Base está em core.database
-
-# class DocumentDB(Base):
-#     __tablename__ = "documents"
-#     id = Column(Integer, primary_key=True, index=True)
-#     filename = Column(String, index=True)
-#     status = Column(String)
-#     # ... outros campos e relacionamentos 
\ No newline at end of file
+# Modelos de dados (SQLAlchemy) do banco embarcado.
+from sqlalchemy import Column, DateTime, Float, Index, Integer, JSON, String, Text, func
+from app.core.database import Base
+
+class StatementRowDB(Base):
+    """Uma linha (conta) de uma demonstração financeira da CVM, normalizada."""
+    __tablename__ = "statement_rows"
+
+    id = Column(Integer, primary_key=True)
+    cnpj = Column(String(18), nullable=False)
+    doc_type = Column(String(3), nullable=False)
+    year = Column(Integer, nullable=False)
+    statement = Column(String(10), nullable=False)
+    cd_conta = Column(String(30), nullable=False)
+    ds_conta = Column(String)
+    vl_conta = Column(Float)
+    versao = Column(Integer)
+    dt_refer = Column(String(10))
+    dt_ini_exerc = Column(String(10))
+    dt_fim_exerc = Column(String(10))
+    ordem_exerc = Column(String(10))
+    escala_moeda = Column(String(10))
+    moeda = Column(String(10))
+    st_conta_fixa = Column(String(1))
+    denom_cia = Column(String)
+    cd_cvm = Column(Integer)
+    grupo_dfp = Column(String)
+
+    __table_args__ = (
+        # Consulta principal: empresa + período (+ demonstração/conta)
+        Index("ix_statement_rows_lookup", "cnpj", "doc_type", "year", "statement", "cd_conta"),
+        # Usado para substituir um período inteiro quando ele é sincronizado novamente
+        Index("ix_statement_rows_period", "doc_type", "year", "statement"),
+    )
+
+class IngestedPeriodDB(Base):
+    """Registro dos períodos (tipo de documento/ano) já gravados no banco."""
+    __tablename__ = "ingested_periods"
+
+    doc_type = Column(String(3), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    row_count = Column(Integer, nullable=False, default=0)
+    # Colunas presentes no CSV de cada demonstração: {"BPA": ["CNPJ_CIA", ...], ...}
+    columns = Column(JSON)
+    ingested_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class ReportDB(Base):
+    """Relatório gerado pela IA, identificado pelo hash dos dados de entrada."""
+    __tablename__ = "reports"
+
+    id = Column(Integer, primary_key=True)
+    cnpj = Column(String(18), nullable=False)
+    doc_type = Column(String(3), nullable=False)
+    year = Column(Integer, nullable=False)
+    input_hash = Column(String(64), nullable=False, unique=True, index=True)
+    model_name = Column(String)
+    report = Column(Text, nullable=False)
+    financial_summary = Column(JSON, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_reports_company_period", "cnpj", "doc_type", "year"),
+    )
+
+class CompanyMetricDB(Base):
+    """Indicador de uma empresa em um período, com sua posição (percentil) entre os pares."""
+    __tablename__ = "company_metrics"
+
+    cnpj = Column(String(18), primary_key=True)
+    doc_type = Column(String(3), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    metric = Column(String(30), primary_key=True)
+    sector = Column(String)
+    value = Column(Float, nullable=False)
+    market_percentile = Column(Float)
+    sector_percentile = Column(Float)
+
+    __table_args__ = (
+        Index("ix_company_metrics_period", "doc_type", "year"),
+    )
+
+class PeerAggregateDB(Base):
+    """Distribuição de um indicador em um período, para o mercado todo (sector = "") ou um setor."""
+    __tablename__ = "peer_aggregates"
+
+    doc_type = Column(String(3), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    sector = Column(String, primary_key=True)
+    metric = Column(String(30), primary_key=True)
+    count = Column(Integer, nullable=False)
+    mean = Column(Float)
+    min = Column(Float)
+    p10 = Column(Float)
+    p25 = Column(Float)
+    median = Column(Float)
+    p75 = Column(Float)
+    p90 = Column(Float)
+    max = Column(Float)
+    computed_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -0,0 +1,282 @@
+# Lógica de negócios dos agregados setoriais e de mercado.
+# - Calcular, após a ingestão de um período, os principais indicadores de cada empresa.
+# - Materializar a distribuição (quantis, mediana, contagem) de cada indicador por setor e para o mercado.
+# - Fornecer o contexto de pares de uma empresa para a API e para o relatório da IA.
+
+from typing import Any, Dict
+import numpy as np
+import pandas as pd
+from app import crud
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services import company_service, cvm_service
+from app.utils.formatters import normalize_text
+
+# Valor da coluna "sector" usado para os agregados do mercado todo
+MARKET_SECTOR = ""
+
+# Contas consolidadas usadas nos indicadores: nome -> (demonstração, código da conta)
+METRIC_ACCOUNTS = {
+    "receita_liquida": ("DRE", "3.01"),
+    "lucro_bruto": ("DRE", "3.03"),
+    "lucro_liquido": ("DRE", "3.11"),
+    "ativo_total": ("BPA", "1"),
+    "passivo_circulante": ("BPP", "2.01"),
+    "passivo_nao_circulante": ("BPP", "2.02"),
+    "patrimonio_liquido": ("BPP", "2.03"),
+}
+
+# Início da descrição (normalizada) de cada conta no plano de contas de empresas comerciais e
+# industriais. Bancos e seguradoras usam outro plano com os mesmos códigos (ex: em bancos a
+# conta 2.03 é "Provisões"); empresas cujas contas não batem ficam fora dos agregados.
+METRIC_ACCOUNT_DESCRIPTIONS = {
+    "receita_liquida": "RECEITA DE VENDA",
+    "lucro_bruto": "RESULTADO BRUTO",
+    "lucro_liquido": "LUCRO",
+    "ativo_total": "ATIVO TOTAL",
+    "passivo_circulante": "PASSIVO CIRCULANTE",
+    "passivo_nao_circulante": "PASSIVO NAO CIRCULANTE",
+    "patrimonio_liquido": "PATRIMONIO LIQUIDO",
+}
+
+# Indicadores materializados (contas absolutas e índices derivados)
+METRICS = [
+    "receita_liquida",
+    "lucro_liquido",
+    "ativo_total",
+    "patrimonio_liquido",
+    "margem_bruta",
+    "margem_liquida",
+    "roe",
+    "passivo_sobre_pl",
+]
+
+QUANTILES = {"p10": 0.10, "p25": 0.25, "median": 0.50, "p75": 0.75, "p90": 0.90}
+
+# Fração mínima das empresas do período que precisa ter entregue uma data de referência
+# para que ela seja usada nos agregados (evita distribuições com poucas empresas no início
+# da temporada de entregas de um trimestre)
+MIN_REFERENCE_COVERAGE = 0.5
+
+def _reference_date(rows: pd.DataFrame) -> str | None:
+    """
+    Escolhe a data de referência (DT_REFER) comum do período: a mais recente entregue por
+    pelo menos MIN_REFERENCE_COVERAGE das empresas ou, se nenhuma atingir a cobertura, a mais frequente.
+    """
+    companies_per_date = rows.dropna(subset=["dt_refer"]).groupby("dt_refer")["cnpj"].nunique()
+    if companies_per_date.empty:
+        return None
+    covered = companies_per_date[companies_per_date >= rows["cnpj"].nunique() * MIN_REFERENCE_COVERAGE]
+    return covered.index.max() if not covered.empty else companies_per_date.idxmax()
+
+def _latest_account_values(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduz as linhas do período a um valor por empresa e conta: data de referência comum
+    a todas as empresas (ver _reference_date), exercício atual ("ÚLTIMO"), data de fim mais
+    recente, última versão e, na DRE, o período acumulado mais longo. Empresas com outro
+    plano de contas (ver METRIC_ACCOUNT_DESCRIPTIONS) são descartadas.
+    Retorna um DataFrame com uma linha por CNPJ e uma coluna por conta de METRIC_ACCOUNTS.
+    """
+    # Sem isso, empresas de trimestres diferentes (ex: um acumulado de 6 meses e outro de 9)
+    # seriam comparadas na mesma distribuição
+    reference_date = _reference_date(rows)
+    if reference_date is not None:
+        rows = rows[rows["dt_refer"] == reference_date]
+
+    if "ordem_exerc" in rows and rows["ordem_exerc"].notna().any():
+        rows = rows[rows["ordem_exerc"].fillna("").str.upper().str.startswith("ÚLTIMO")]
+
+    rows = rows.sort_values(
+        ["dt_fim_exerc", "versao", "dt_ini_exerc"],
+        ascending=[False, False, True],
+        na_position="last",
+    ).drop_duplicates(subset=["cnpj", "statement", "cd_conta"])
+
+    # Os valores podem estar em milhares (ESCALA_MOEDA = "MIL"); normaliza para unidades
+    scale = np.where(rows["escala_moeda"].fillna("").str.upper() == "MIL", 1000.0, 1.0)
+    rows = rows.assign(value=rows["vl_conta"].astype(float) * scale)
+
+    account_names = {account: name for name, account in METRIC_ACCOUNTS.items()}
+    rows = rows.assign(account=[account_names[(s, c)] for s, c in zip(rows["statement"], rows["cd_conta"])])
+
+    layout_matches = pd.Series([
+        normalize_text(description).startswith(METRIC_ACCOUNT_DESCRIPTIONS[account])
+        for account, description in zip(rows["account"], rows["ds_conta"])
+    ], index=rows.index)
+    other_layout = rows.loc[~layout_matches, "cnpj"].unique()
+    if len(other_layout):
+        print(f"Aviso: {len(other_layout)} empresa(s) com outro plano de contas (ex: bancos, seguradoras) fora dos agregados.")
+    rows = rows[~rows["cnpj"].isin(other_layout)]
+    return rows.pivot(index="cnpj", columns="account", values="value").reindex(columns=list(METRIC_ACCOUNTS))
+
+def _safe_ratio(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    return numerator / denominator.where(denominator > 0)
+
+def compute_company_metrics(accounts: pd.DataFrame) -> pd.DataFrame:
+    """Calcula os indicadores de METRICS a partir das contas de cada empresa."""
+    metrics = pd.DataFrame(index=accounts.index)
+    for name in ["receita_liquida", "lucro_liquido", "ativo_total", "patrimonio_liquido"]:
+        metrics[name] = accounts[name]
+    metrics["margem_bruta"] = _safe_ratio(accounts["lucro_bruto"], accounts["receita_liquida"])
+    metrics["margem_liquida"] = _safe_ratio(accounts["lucro_liquido"], accounts["receita_liquida"])
+    metrics["roe"] = _safe_ratio(accounts["lucro_liquido"], accounts["patrimonio_liquido"])
+    metrics["passivo_sobre_pl"] = _safe_ratio(
+        accounts["passivo_circulante"].fillna(0) + accounts["passivo_nao_circulante"].fillna(0),
+        accounts["patrimonio_liquido"],
+    )
+    return metrics.replace([np.inf, -np.inf], np.nan)
+
+def _distribution(values: pd.Series) -> Dict[str, Any]:
+    distribution = {"count": int(values.count()), "mean": float(values.mean()), "min": float(values.min()), "max": float(values.max())}
+    distribution.update({name: float(values.quantile(q)) for name, q in QUANTILES.items()})
+    return distribution
+
+def _company_sector(cnpj: str) -> str | None:
+    return (company_service.get_company(cnpj) or {}).get("sector")
+
+def aggregate_period(doc_type: str, year: int, extracted_path: str = None) -> int:
+    """
+    Recalcula os indicadores e os agregados de um único período, substituindo os anteriores.
+    Registrada como etapa pós-ingestão, depois da gravação no banco e do diretório de empresas,
+    de modo que uma nova sincronização de um ano atualiza apenas aquele período.
+
+    Returns:
+        O número de empresas com indicadores calculados.
+    """
+    if not settings.STATEMENT_STORE_ENABLED:
+        return 0
+
+    with SessionLocal() as db:
+        rows = crud.get_period_account_rows(db, doc_type, year, list(METRIC_ACCOUNTS.values()))
+        if rows.empty:
+            print(f"Nenhuma conta encontrada para calcular agregados de {doc_type}/{year}.")
+            return 0
+
+        metrics = compute_company_metrics(_latest_account_values(rows))
+        metrics["sector"] = [_company_sector(cnpj) for cnpj in metrics.index]
+
+        long_metrics = metrics.reset_index().melt(
+            id_vars=["cnpj", "sector"], value_vars=METRICS, var_name="metric", value_name="value"
+        ).dropna(subset=["value"])
+
+        long_metrics["market_percentile"] = long_metrics.groupby("metric")["value"].rank(pct=True)
+        long_metrics["sector_percentile"] = long_metrics.groupby(["metric", "sector"])["value"].rank(pct=True)
+
+        aggregates = []
+        for metric, values in long_metrics.groupby("metric")["value"]:
+            aggregates.append({"doc_type": doc_type, "year": year, "sector": MARKET_SECTOR, "metric": metric, **_distribution(values)})
+        for (metric, sector), values in long_metrics.dropna(subset=["sector"]).groupby(["metric", "sector"])["value"]:
+            aggregates.append({"doc_type": doc_type, "year": year, "sector": sector, "metric": metric, **_distribution(values)})
+
+        long_metrics = long_metrics.assign(doc_type=doc_type, year=year)
+        company_records = long_metrics.astype(object).where(pd.notna(long_metrics), None).to_dict(orient="records")
+        crud.replace_period_aggregates(db, doc_type, year, company_records, aggregates)
+
+    print(f"Agregados de {doc_type}/{year} calculados: {len(metrics)} empresas, {len(aggregates)} distribuições.")
+    return len(metrics)
+
+def refresh_sector_aggregates() -> int:
+    """
+    Recalcula os agregados dos períodos calculados com setores diferentes dos atuais do
+    diretório (ex: agregados calculados antes de o cadastro da CVM ser carregado).
+    Registrada como etapa pós-atualização dos dados cadastrais.
+
+    Returns:
+        O número de períodos recalculados.
+    """
+    if not settings.STATEMENT_STORE_ENABLED:
+        return 0
+
+    with SessionLocal() as db:
+        periods = crud.list_aggregated_periods(db)
+    refreshed = []
+    for doc_type, year in periods:
+        with SessionLocal() as db:
+            stored_sectors = crud.get_period_company_sectors(db, doc_type, year)
+        if any(sector != _company_sector(cnpj) for cnpj, sector in stored_sectors.items()):
+            # No worker de ingestão, para não concorrer com a gravação de outro período
+            refreshed.append(cvm_service.run_in_background(("aggregate", doc_type, year), aggregate_period, doc_type, year))
+    for future in refreshed:
+        future.result()
+    if refreshed:
+        print(f"Agregados por setor recalculados para {len(refreshed)} período(s).")
+    return len(refreshed)
+
+def ensure_period_aggregated(doc_type: str, year: int, wait: bool = False) -> bool:
+    """
+    Garante que os agregados de um período existem, agendando a gravação do período no banco
+    e o cálculo dos agregados no worker de ingestão se necessário.
+
+    Args:
+        wait: Se False (requisições), apenas agenda o que falta e retorna sem esperar.
+
+    Returns:
+        True se os agregados estão disponíveis.
+    """
+    if not cvm_service.ensure_period_stored(doc_type, year, wait=wait):
+        return False
+    with SessionLocal() as db:
+        if crud.is_period_aggregated(db, doc_type, year):
+            return True
+    future = cvm_service.run_in_background(("aggregate", doc_type, year), aggregate_period, doc_type, year)
+    return wait and future.result() > 0
+
+def _aggregate_to_dict(aggregate) -> Dict[str, Any]:
+    return {
+        "count": aggregate.count,
+        "mean": aggregate.mean,
+        "min": aggregate.min,
+        **{name: getattr(aggregate, name) for name in QUANTILES},
+        "max": aggregate.max,
+    }
+
+def get_period_aggregates(doc_type: str, year: int, sector: str = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Retorna as distribuições de um período: {"mercado" | setor: {indicador: distribuição}}.
+    """
+    with SessionLocal() as db:
+        aggregates = crud.get_period_aggregates(db, doc_type, year, sector)
+    result: Dict[str, Dict[str, Any]] = {}
+    for aggregate in aggregates:
+        scope = "mercado" if aggregate.sector == MARKET_SECTOR else aggregate.sector
+        result.setdefault(scope, {})[aggregate.metric] = _aggregate_to_dict(aggregate)
+    return result
+
+def get_peer_context(cnpj: str, doc_type: str, year: int) -> Dict[str, Any] | None:
+    """
+    Retorna os indicadores de uma empresa no período com seus percentis e as distribuições
+    do mercado e do setor, lidos dos agregados já materializados.
+
+    Returns:
+        O contexto de pares ou None se não houver indicadores da empresa no período.
+    """
+    with SessionLocal() as db:
+        rows = crud.get_company_peer_context(db, cnpj, doc_type, year, MARKET_SECTOR)
+    if not rows:
+        return None
+
+    sector = rows[0][0].sector
+    metrics: Dict[str, Any] = {}
+    for company_metric, aggregate in rows:
+        entry = metrics.setdefault(company_metric.metric, {
+            "value": company_metric.value,
+            "market_percentile": company_metric.market_percentile,
+            "sector_percentile": company_metric.sector_percentile,
+            "market": None,
+            "sector": None,
+        })
+        scope = "market" if aggregate.sector == MARKET_SECTOR else "sector"
+        entry[scope] = _aggregate_to_dict(aggregate)
+
+    # Sem o setor (cadastro da CVM desativado ou indisponível), só há a comparação com o mercado
+    return {
+        "cnpj": cnpj,
+        "doc_type": doc_type,
+        "year": year,
+        "sector": sector,
+        "sector_available": sector is not None,
+        "metrics": metrics,
+    }
+
+cvm_service.register_ingestion_hook(aggregate_period)
+company_service.register_reference_data_hook(refresh_sector_aggregates)
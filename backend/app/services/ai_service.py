@@ -3,70 +3,150 @@
 # - Receber e interpretar as análises da IA.
 # - Formatar a saída da IA para ser usada na geração de relatórios. 
 
+import hashlib
 import json
 import re
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 from app.core.config import settings
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Tuple
 import pandas as pd
 
 # Configura a biblioteca do Google com a chave de API das nossas configurações
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
-def generate_financial_analysis(company_financials: Dict[str, pd.DataFrame]) -> Dict[str, Any] | None:
+GEMINI_MODEL_NAME = 'gemini-2.5-pro-preview-05-06'
+
+# Indicadores esperados no "financial_summary"
+FINANCIAL_SUMMARY_KEYS = [
+    "Receita Liquida",
+    "Lucro Bruto",
+    "Lucro Liquido",
+    "Ativo Total",
+    "Passivo Total",
+    "Patrimonio Liquido",
+]
+
+# Marcador que separa o texto do relatório do resumo JSON na geração em streaming
+SUMMARY_MARKER = "###FINANCIAL_SUMMARY###"
+
+ANALYST_INSTRUCTIONS = """
+        Você é um analista financeiro sênior, especializado no mercado de ações brasileiro.
+        Seu trabalho é analisar dados financeiros e gerar um relatório conciso para investidores.
+        A linguagem deve ser formal, direta e clara.
+"""
+
+REPORT_STRUCTURE = """
+        1.  **Visão Geral da Empresa:** Resumo da saúde financeira.
+        2.  **Análise do Balanço Patrimonial (BPA e BPP):** Comente sobre ativos, passivos, endividamento e patrimônio líquido.
+        3.  **Análise da Demonstração de Resultado (DRE):** Analise receita líquida, lucro bruto e lucro líquido.
+        4.  **Conclusão e Pontos de Atenção:** Conclusão final e 2-3 pontos de atenção (positivos ou negativos).
+"""
+
+SUMMARY_STRUCTURE = """
+        Extraia os seguintes valores dos dados e coloque-os neste objeto. Se um valor não estiver disponível, use 0.
+""" + "".join(f'        - "{key}": valor\n' for key in FINANCIAL_SUMMARY_KEYS)
+
+def prepare_financial_data(company_financials: Dict[str, pd.DataFrame]) -> Dict[str, list]:
+    """
+    Converte os DataFrames das demonstrações para um formato JSON legível para a IA,
+    mantendo apenas a última versão e o último exercício de cada conta.
+    """
+    financial_data_json = {}
+    for statement, df in company_financials.items():
+        df_filtered = df.loc[df.groupby('CD_CONTA')['VERSAO'].idxmax()]
+        df_filtered = df_filtered.loc[df_filtered.groupby('CD_CONTA')['DT_FIM_EXERC'].idxmax()]
+        relevant_data = df_filtered[['DS_CONTA', 'VL_CONTA']].drop_duplicates(subset=['DS_CONTA'])
+        # Células vazias viram null: NaN não é JSON válido (prompt e eventos SSE)
+        relevant_data = relevant_data.astype(object).where(pd.notna(relevant_data), None)
+        financial_data_json[statement] = relevant_data.to_dict(orient='records')
+    return financial_data_json
+
+def _peer_context_section(peer_context: Dict[str, Any] | None) -> str:
+    """Monta a seção do prompt com o contexto setorial e de mercado, se disponível."""
+    if not peer_context:
+        return ""
+    return """
+        **Contexto Setorial e de Mercado:**
+        Indicadores da empresa com seus percentis (0 a 1) entre as companhias do mercado e do setor,
+        e a distribuição de cada indicador entre os pares. Use-os para situar a empresa em relação aos pares.
+        {context}
+    """.format(context=json.dumps(peer_context, indent=2, ensure_ascii=False, default=str))
+
+def compute_input_hash(financial_data_json: Dict[str, list], peer_context: Dict[str, Any] = None) -> str:
+    """
+    Calcula um hash dos dados de entrada da análise (e do modelo usado), que identifica
+    relatórios já gerados e permite reaproveitá-los sem chamar a IA novamente.
+    """
+    payload = json.dumps(
+        {"model": GEMINI_MODEL_NAME, "financial_data": financial_data_json, "peer_context": peer_context},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def validate_financial_summary(summary: Any) -> Dict[str, float] | None:
+    """
+    Valida o resumo financeiro retornado pela IA: todas as chaves esperadas, com valores numéricos.
+    Valores ausentes viram 0, como pedido no prompt.
+
+    Returns:
+        O resumo normalizado ou None se não for um objeto JSON ou tiver valores não numéricos.
+    """
+    if not isinstance(summary, dict):
+        return None
+    validated = {}
+    for key in FINANCIAL_SUMMARY_KEYS:
+        value = summary.get(key, 0)
+        if value is None:
+            value = 0
+        try:
+            validated[key] = float(value)
+        except (TypeError, ValueError):
+            print(f"Valor inválido para '{key}' no resumo financeiro: {value!r}")
+            return None
+    return validated
+
+def generate_financial_analysis(
+    company_financials: Dict[str, pd.DataFrame],
+    peer_context: Dict[str, Any] = None
+) -> Dict[str, Any] | None:
     """
     Usa o Google Gemini Pro para gerar uma análise financeira a partir dos dados da empresa.
 
     Args:
         company_financials: Um dicionário onde as chaves são os nomes das demonstrações
                             (ex: "BPA", "DRE") e os valores são DataFrames do pandas.
+        peer_context: Contexto de pares (aggregation_service.get_peer_context), opcional.
 
     Returns:
         Um dicionário com a análise gerada pela IA e dados financeiros, ou None em caso de erro.
     """
     try:
         # 1. Converter os DataFrames para um formato JSON legível para a IA
-        financial_data_json = {}
-        for statement, df in company_financials.items():
-            df_filtered = df.loc[df.groupby('CD_CONTA')['VERSAO'].idxmax()]
-            df_filtered = df_filtered.loc[df_filtered.groupby('CD_CONTA')['DT_FIM_EXERC'].idxmax()]
-            relevant_data = df_filtered[['DS_CONTA', 'VL_CONTA']].drop_duplicates(subset=['DS_CONTA'])
-            financial_data_json[statement] = relevant_data.to_dict(orient='records')
+        financial_data_json = prepare_financial_data(company_financials)
 
         # 2. Construir o prompt para a IA
-        prompt = """
-        Você é um analista financeiro sênior, especializado no mercado de ações brasileiro.
-        Seu trabalho é analisar dados financeiros e gerar um relatório conciso para investidores.
-        A linguagem deve ser formal, direta e clara.
-
+        prompt = (ANALYST_INSTRUCTIONS + """
         **Tarefa:**
         Baseado nos dados financeiros em JSON fornecidos, gere uma resposta JSON contendo DUAS chaves:
         1. "report": Uma string com a análise textual fundamentalista, seguindo a estrutura abaixo.
         2. "financial_summary": Um objeto JSON com os valores numéricos exatos para os principais indicadores financeiros extraídos diretamente dos dados.
 
         **Estrutura do Relatório Textual ("report"):**
-        1.  **Visão Geral da Empresa:** Resumo da saúde financeira.
-        2.  **Análise do Balanço Patrimonial (BPA e BPP):** Comente sobre ativos, passivos, endividamento e patrimônio líquido.
-        3.  **Análise da Demonstração de Resultado (DRE):** Analise receita líquida, lucro bruto e lucro líquido.
-        4.  **Conclusão e Pontos de Atenção:** Conclusão final e 2-3 pontos de atenção (positivos ou negativos).
-
+        """ + REPORT_STRUCTURE + """
         **Estrutura do Resumo Financeiro ("financial_summary"):**
-        Extraia os seguintes valores dos dados e coloque-os neste objeto. Se um valor não estiver disponível, use 0.
-        - "Receita Liquida": valor
-        - "Lucro Bruto": valor
-        - "Lucro Liquido": valor
-        - "Ativo Total": valor
-        - "Passivo Total": valor
-        - "Patrimonio Liquido": valor
-
+        """ + SUMMARY_STRUCTURE + """
         **Dados Financeiros:**
         {financial_data}
-        """.format(financial_data=json.dumps(financial_data_json, indent=2, ensure_ascii=False))
+        {peer_context}
+        """).format(
+            financial_data=json.dumps(financial_data_json, indent=2, ensure_ascii=False),
+            peer_context=_peer_context_section(peer_context)
+        )
 
         # 3. Chamar a API do Google Gemini com configuração para JSON
         print("Enviando dados para análise do Google Gemini Pro (modo JSON)...")
-        model = genai.GenerativeModel('gemini-2.5-pro-preview-05-06')
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         
         # Forçar a saída em JSON de forma explícita
         generation_config = GenerationConfig(response_mime_type="application/json")
@@ -99,4 +179,114 @@ def generate_financial_analysis(company_financials: Dict[str, pd.DataFrame]) ->
         response_obj = locals().get("response", None)
         if response_obj and hasattr(response_obj, 'prompt_feedback'):
              print(f"Prompt Feedback: {response_obj.prompt_feedback}")
-        return None 
\ No newline at end of file
+        return None 
+
+def _chunk_text(chunk) -> str:
+    """
+    Retorna o texto de um pedaço da resposta em streaming. `chunk.text` lança ValueError
+    quando o pedaço não tem partes (ex: o último, que só traz o finish_reason).
+    """
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+def stream_financial_analysis(
+    financial_data_json: Dict[str, list],
+    peer_context: Dict[str, Any] = None
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Gera a análise financeira em streaming: o texto do relatório é repassado à medida que o
+    Gemini o produz e o resumo financeiro é validado e emitido ao final.
+
+    Args:
+        financial_data_json: Os dados já preparados por prepare_financial_data.
+        peer_context: Contexto de pares (aggregation_service.get_peer_context), opcional.
+
+    Yields:
+        Tuplas (evento, dados): ("report_chunk", str), ("financial_summary", dict) ou ("error", str).
+    """
+    prompt = ANALYST_INSTRUCTIONS + """
+        **Tarefa:**
+        Baseado nos dados financeiros em JSON fornecidos, escreva a análise textual fundamentalista
+        em texto corrido (Markdown), seguindo a estrutura abaixo. NÃO responda em JSON.
+
+        **Estrutura do Relatório:**
+        """ + REPORT_STRUCTURE + """
+        Ao terminar o relatório, escreva em uma nova linha exatamente o marcador {marker}
+        seguido de um objeto JSON (e nada mais depois dele) com os valores numéricos exatos
+        dos principais indicadores financeiros extraídos diretamente dos dados.
+
+        **Estrutura do Resumo Financeiro:**
+        """ + SUMMARY_STRUCTURE + """
+        **Dados Financeiros:**
+        {financial_data}
+        {peer_context}
+        """
+    prompt = prompt.format(
+        marker=SUMMARY_MARKER,
+        financial_data=json.dumps(financial_data_json, indent=2, ensure_ascii=False),
+        peer_context=_peer_context_section(peer_context)
+    )
+
+    try:
+        print("Enviando dados para análise do Google Gemini Pro (modo streaming)...")
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        response = model.generate_content(prompt, stream=True)
+
+        # Texto ainda não enviado: guardamos o final do buffer enquanto ele puder ser
+        # o começo do marcador, para não vazar parte do marcador no relatório.
+        pending = ""
+        summary_text = None
+        try:
+            for chunk in response:
+                text = _chunk_text(chunk)
+                if summary_text is not None:
+                    summary_text += text
+                    continue
+
+                pending += text
+                marker_pos = pending.find(SUMMARY_MARKER)
+                if marker_pos != -1:
+                    if pending[:marker_pos]:
+                        yield "report_chunk", pending[:marker_pos]
+                    summary_text = pending[marker_pos + len(SUMMARY_MARKER):]
+                    pending = ""
+                    continue
+
+                safe_len = len(pending) - len(SUMMARY_MARKER) + 1
+                if safe_len > 0:
+                    yield "report_chunk", pending[:safe_len]
+                    pending = pending[safe_len:]
+        except Exception as e:
+            # Depois do marcador, um erro no fim do stream não descarta o resumo já recebido
+            if summary_text is None:
+                raise
+            print(f"Aviso: O stream do Gemini terminou com erro após o resumo financeiro: {e}")
+
+        if summary_text is None:
+            if pending:
+                yield "report_chunk", pending
+            yield "error", "A resposta da IA não contém o resumo financeiro."
+            return
+
+        # O modelo pode envolver o JSON em um bloco de código Markdown ou escrever algo
+        # depois dele: decodificamos só o primeiro objeto JSON após o marcador
+        json_start = summary_text.find("{")
+        if json_start == -1:
+            raise json.JSONDecodeError("Objeto JSON não encontrado após o marcador", summary_text, 0)
+        summary_obj, _ = json.JSONDecoder().raw_decode(summary_text, json_start)
+        summary = validate_financial_summary(summary_obj)
+        if summary is None:
+            yield "error", "O resumo financeiro retornado pela IA é inválido."
+            return
+
+        print("Análise em streaming recebida e processada do Gemini com sucesso.")
+        yield "financial_summary", summary
+
+    except json.JSONDecodeError as e:
+        print(f"Erro de decodificação JSON no resumo financeiro em streaming: {e}")
+        yield "error", "O resumo financeiro retornado pela IA não é um JSON válido."
+    except Exception as e:
+        print(f"Ocorreu um erro inesperado ao gerar a análise em streaming com o Gemini: {e}")
+        yield "error", "Ocorreu um erro no serviço de IA ao tentar gerar a análise."
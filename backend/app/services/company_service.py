@@ -0,0 +1,353 @@
+# Lógica de negócios do diretório de empresas.
+# - Construir, durante a ingestão, um índice das companhias presentes nos arquivos da CVM.
+# - Enriquecer o índice com o cadastro de companhias abertas da CVM (quando disponível).
+# - Responder buscas por nome, ticker ou CNPJ (autocomplete) a partir do índice em memória.
+
+import json
+import os
+import re
+import threading
+import zipfile
+from bisect import bisect_left
+from datetime import date
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Tuple
+import pandas as pd
+from app.core.config import settings
+from app.services import cvm_service
+from app.utils.formatters import cnpj_digits, format_cnpj, normalize_text
+
+CADASTRO_URL_SEGMENT = "CIA_ABERTA/CAD/DADOS/cad_cia_aberta.csv"
+# Formulário Cadastral (FCA): o arquivo de valores mobiliários traz os códigos de negociação
+FCA_ZIP_URL_SEGMENT = "CIA_ABERTA/DOC/FCA/DADOS/fca_cia_aberta_{year}.zip"
+FCA_TICKERS_CSV = "fca_cia_aberta_valor_mobiliario_{year}.csv"
+
+# Empresas indexadas pelos dígitos do CNPJ
+_companies: Dict[str, Dict[str, Any]] = {}
+# Chaves de busca ordenadas: (chave normalizada, dígitos do CNPJ). A busca por prefixo
+# é feita com bisect, sem percorrer o diretório inteiro.
+_search_keys: List[Tuple[str, str]] = []
+_index_lock = threading.Lock()
+# Evita que a inicialização e o agendador baixem os dados cadastrais ao mesmo tempo
+_refresh_lock = threading.Lock()
+# Funções chamadas após cada atualização dos dados cadastrais (ex: recálculo dos agregados por setor)
+_reference_data_hooks: List[Callable[[], None]] = []
+
+def _new_company(digits: str) -> Dict[str, Any]:
+    return {
+        "cnpj": format_cnpj(digits),
+        "name": None,
+        "trade_name": None,
+        "cd_cvm": None,
+        "sector": None,
+        "status": None,
+        "tickers": [],
+        "years": {},
+    }
+
+def _company_keys(digits: str, company: Dict[str, Any]) -> List[str]:
+    """Gera as chaves de busca de uma empresa: nomes completos, cada palavra dos nomes, tickers e CNPJ."""
+    keys = {digits}
+    for name in (company.get("name"), company.get("trade_name")):
+        normalized = normalize_text(name)
+        if not normalized:
+            continue
+        keys.add(normalized)
+        keys.update(word for word in normalized.split() if len(word) > 1)
+    keys.update(normalize_text(ticker) for ticker in company.get("tickers", []))
+    return [key for key in keys if key]
+
+def _rebuild_search_keys() -> None:
+    global _search_keys
+    keys = sorted(
+        (key, digits)
+        for digits, company in _companies.items()
+        for key in _company_keys(digits, company)
+    )
+    # Substituição atômica: buscas em andamento continuam usando a lista anterior
+    _search_keys = keys
+
+def save_index(path: str = None) -> None:
+    """Persiste o diretório de empresas em JSON."""
+    path = path or settings.COMPANY_INDEX_PATH
+    with _index_lock:
+        data = {"companies": _companies}
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+        except OSError as e:
+            print(f"Não foi possível salvar o diretório de empresas em {path}: {e}")
+
+def load_index(path: str = None) -> bool:
+    """
+    Carrega o diretório de empresas persistido por save_index.
+
+    Returns:
+        True se o índice foi carregado, False se o arquivo não existe ou é inválido.
+    """
+    path = path or settings.COMPANY_INDEX_PATH
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Não foi possível carregar o diretório de empresas de {path}: {e}")
+        return False
+
+    with _index_lock:
+        _companies.clear()
+        _companies.update(data.get("companies", {}))
+        _rebuild_search_keys()
+    print(f"Diretório de empresas carregado: {len(_companies)} empresas.")
+    return True
+
+def index_period(doc_type: str, year: int, extracted_path: str, save: bool = True) -> int:
+    """
+    Adiciona ao diretório as empresas presentes nas demonstrações de um tipo/ano extraído.
+    Registrada como etapa pós-ingestão do cvm_service.
+
+    Returns:
+        O número de empresas encontradas no período.
+    """
+    frames = []
+    for file_pattern in cvm_service.STATEMENT_FILES_MAP.values():
+        csv_path = os.path.join(extracted_path, file_pattern.format(doc_type=doc_type.lower(), year=year))
+        if not os.path.exists(csv_path):
+            continue
+        df = cvm_service.read_cvm_csv(csv_path, usecols=['CNPJ_CIA', 'DENOM_CIA', 'CD_CVM'])
+        if df is not None:
+            frames.append(df.drop_duplicates(subset=['CNPJ_CIA']))
+
+    if not frames:
+        print(f"Nenhuma demonstração encontrada para indexar empresas de {doc_type}/{year}.")
+        return 0
+
+    period_companies = pd.concat(frames).drop_duplicates(subset=['CNPJ_CIA'])
+
+    with _index_lock:
+        for row in period_companies.itertuples(index=False):
+            digits = cnpj_digits(row.CNPJ_CIA)
+            if len(digits) != 14:
+                continue
+            company = _companies.setdefault(digits, _new_company(digits))
+            # O cadastro da CVM tem prioridade sobre o nome informado nas demonstrações
+            if not company["name"] and isinstance(row.DENOM_CIA, str):
+                company["name"] = row.DENOM_CIA.strip()
+            if company["cd_cvm"] is None and pd.notna(row.CD_CVM):
+                company["cd_cvm"] = int(row.CD_CVM)
+            years = company["years"].setdefault(doc_type, [])
+            if year not in years:
+                years.append(year)
+                years.sort()
+        _rebuild_search_keys()
+
+    print(f"Diretório de empresas atualizado com {len(period_companies)} empresas de {doc_type}/{year}.")
+    if save:
+        save_index()
+    return len(period_companies)
+
+def refresh_cadastro(save: bool = True) -> int:
+    """
+    Baixa o cadastro de companhias abertas da CVM e enriquece o diretório com razão social,
+    nome comercial, setor e situação. Companhias ativas ainda sem demonstrações também são incluídas.
+
+    Returns:
+        O número de companhias lidas do cadastro (0 em caso de falha).
+    """
+    content = cvm_service.download_cvm_file(CADASTRO_URL_SEGMENT)
+    if not content:
+        print("Cadastro de companhias da CVM indisponível. Mantendo o diretório atual.")
+        return 0
+
+    try:
+        cadastro = pd.read_csv(
+            BytesIO(content), sep=';', encoding='latin-1', dtype=str,
+            usecols=['CNPJ_CIA', 'DENOM_SOCIAL', 'DENOM_COMERC', 'CD_CVM', 'SETOR_ATIV', 'SIT']
+        )
+    except Exception as e:
+        print(f"Ocorreu um erro ao ler o cadastro de companhias da CVM: {e}")
+        return 0
+
+    cadastro = cadastro.astype(object).where(pd.notna(cadastro), None)
+    # Um CNPJ pode aparecer mais de uma vez (registros antigos ou cancelados). Como a última
+    # linha de cada CNPJ prevalece, os registros ativos são processados por último.
+    cadastro = cadastro.iloc[cadastro['SIT'].eq("ATIVO").to_numpy().argsort(kind="stable")]
+
+    with _index_lock:
+        for row in cadastro.itertuples(index=False):
+            digits = cnpj_digits(row.CNPJ_CIA)
+            if len(digits) != 14:
+                continue
+            if digits not in _companies and row.SIT != "ATIVO":
+                continue
+            company = _companies.setdefault(digits, _new_company(digits))
+            company["name"] = (row.DENOM_SOCIAL or company["name"] or "").strip() or None
+            company["trade_name"] = row.DENOM_COMERC.strip() if row.DENOM_COMERC else company["trade_name"]
+            company["cd_cvm"] = int(row.CD_CVM) if row.CD_CVM and row.CD_CVM.isdigit() else company["cd_cvm"]
+            company["sector"] = row.SETOR_ATIV or company["sector"]
+            company["status"] = row.SIT or company["status"]
+        _rebuild_search_keys()
+
+    print(f"Diretório de empresas enriquecido com {len(cadastro)} registros do cadastro da CVM.")
+    if save:
+        save_index()
+    return len(cadastro)
+
+def apply_tickers(valores_mobiliarios: pd.DataFrame) -> int:
+    """
+    Substitui os tickers das empresas do diretório pelos códigos de negociação informados.
+
+    Args:
+        valores_mobiliarios: DataFrame com as colunas CNPJ_Companhia e Codigo_Negociacao.
+
+    Returns:
+        O número de empresas com tickers atualizados.
+    """
+    df = valores_mobiliarios.dropna(subset=['CNPJ_Companhia', 'Codigo_Negociacao'])
+    updated = 0
+    with _index_lock:
+        for cnpj, group in df.groupby('CNPJ_Companhia'):
+            company = _companies.get(cnpj_digits(cnpj))
+            if company is None:
+                continue
+            tickers = {str(t).strip().upper() for t in group['Codigo_Negociacao'] if str(t).strip()}
+            company["tickers"] = sorted(tickers)
+            updated += 1
+        _rebuild_search_keys()
+    return updated
+
+def refresh_tickers(year: int = None, save: bool = True) -> int:
+    """
+    Baixa o FCA da CVM (do ano informado ou, se omitido, do ano atual ou anterior) e
+    atualiza os tickers do diretório a partir do arquivo de valores mobiliários.
+
+    Returns:
+        O número de empresas com tickers atualizados (0 em caso de falha).
+    """
+    current_year = date.today().year
+    content = None
+    for candidate in ([year] if year else [current_year, current_year - 1]):
+        content = cvm_service.download_cvm_file(FCA_ZIP_URL_SEGMENT.format(year=candidate))
+        if content:
+            break
+    if not content:
+        print("FCA da CVM indisponível. Mantendo os tickers atuais.")
+        return 0
+
+    try:
+        with zipfile.ZipFile(BytesIO(content)) as zf:
+            with zf.open(FCA_TICKERS_CSV.format(year=candidate)) as csv_file:
+                valores_mobiliarios = pd.read_csv(
+                    csv_file, sep=';', encoding='latin-1', dtype=str,
+                    usecols=['CNPJ_Companhia', 'Codigo_Negociacao']
+                )
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        print(f"Ocorreu um erro ao ler os valores mobiliários do FCA de {candidate}: {e}")
+        return 0
+
+    updated = apply_tickers(valores_mobiliarios)
+    print(f"Tickers atualizados para {updated} empresas a partir do FCA de {candidate}.")
+    if save:
+        save_index()
+    return updated
+
+def register_reference_data_hook(hook: Callable[[], None]) -> None:
+    """
+    Registra uma função a ser chamada após cada atualização dos dados cadastrais.
+    Usado para recalcular dados derivados do setor das empresas.
+    """
+    if hook not in _reference_data_hooks:
+        _reference_data_hooks.append(hook)
+
+def _run_reference_data_hooks() -> None:
+    for hook in _reference_data_hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"Erro ao executar etapa pós-cadastro {getattr(hook, '__name__', hook)}: {e}")
+
+def refresh_reference_data() -> None:
+    """
+    Atualiza os dados cadastrais (cadastro da CVM) e os tickers (FCA) do diretório.
+    Chamada na inicialização e a cada ciclo do agendador de pré-carregamento.
+    Se uma atualização já estiver em andamento, a chamada é ignorada.
+    """
+    if not settings.COMPANY_CADASTRO_ENABLED:
+        return
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        cadastro_count = refresh_cadastro(save=False)
+        refresh_tickers(save=False)
+        save_index()
+    finally:
+        _refresh_lock.release()
+    if cadastro_count:
+        _run_reference_data_hooks()
+
+def rebuild_index() -> None:
+    """Reconstrói o diretório a partir de todos os períodos já extraídos localmente e dos dados cadastrais."""
+    for doc_type, year, path in cvm_service.list_local_periods():
+        index_period(doc_type, year, path, save=False)
+    save_index()
+    refresh_reference_data()
+
+def start() -> None:
+    """
+    Carrega o diretório persistido e, em segundo plano para não atrasar a inicialização
+    da API, o reconstrói (se ainda não existir) e atualiza os dados cadastrais.
+    """
+    loaded = load_index()
+    target = refresh_reference_data if loaded else rebuild_index
+    threading.Thread(target=target, name="company-index", daemon=True).start()
+
+def get_company(cnpj: str) -> Dict[str, Any] | None:
+    """Retorna a empresa com o CNPJ informado (formatado ou apenas dígitos)."""
+    return _companies.get(cnpj_digits(cnpj))
+
+def search_companies(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Busca empresas por prefixo do nome (sem acentos, em qualquer palavra), do ticker ou do CNPJ.
+    Empresas cujo nome começa com o termo buscado aparecem primeiro.
+
+    Args:
+        query: Termo digitado pelo usuário (ex: "petro", "PETR4", "33.000.167").
+        limit: Número máximo de resultados.
+
+    Returns:
+        Uma lista de empresas do diretório.
+    """
+    # Termos formados só por dígitos e pontuação de CNPJ são buscados pelos dígitos do CNPJ
+    if re.fullmatch(r"[\d./\-\s]+", query or ""):
+        prefix = cnpj_digits(query)
+    else:
+        prefix = normalize_text(query)
+    if not prefix:
+        return []
+
+    keys = _search_keys
+    matches: List[str] = []
+    seen = set()
+    # Coletamos alguns candidatos além do limite para ordenar por relevância
+    max_candidates = limit * 5
+    position = bisect_left(keys, (prefix, ""))
+    while position < len(keys) and len(matches) < max_candidates:
+        key, digits = keys[position]
+        if not key.startswith(prefix):
+            break
+        if digits not in seen:
+            seen.add(digits)
+            matches.append(digits)
+        position += 1
+
+    results = [_companies[digits] for digits in matches if digits in _companies]
+    results.sort(key=lambda company: (
+        not normalize_text(company.get("name")).startswith(prefix),
+        not company.get("years"),
+        normalize_text(company.get("name")),
+    ))
+    return results[:limit]
+
+cvm_service.register_ingestion_hook(index_period)
@@ -4,8 +4,15 @@ import os # Adicionado para manipulação de caminhos e diretórios
 import zipfile # Adicionado para manipulação de arquivos ZIP
 from io import BytesIO # Adicionado para manipular o ZIP em memória
 import pandas as pd # Adicionado pandas
-from typing import Dict, List, Literal # Adicionado
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Literal, Tuple # Adicionado
 from app.core.config import settings # Importa as configurações centralizadas
+from app import crud
+from app.core.database import SessionLocal
 
 # Lógica de negócios para buscar, baixar e processar inicialmente
 # os documentos FRE e ITR da CVM.
@@ -27,6 +34,81 @@ STATEMENT_FILES_MAP = {
     "DFC_MI": "{doc_type}_cia_aberta_DFC_MI_con_{year}.csv", # Fluxo de Caixa (Método Indireto)
 }
 
+# --- Caches em memória ---
+# Listagem de arquivos .zip por tipo de documento: doc_type -> (timestamp, lista)
+_zip_listing_cache: Dict[str, Tuple[float, list[str]]] = {}
+# Tabelas já lidas e indexadas por CNPJ: (doc_type, ano, demonstração) -> DataFrame (LRU)
+_statements_cache: "OrderedDict[Tuple[str, int, str], pd.DataFrame]" = OrderedDict()
+_cache_lock = threading.Lock()
+# Um lock por período evita que duas requisições baixem/leiam/gravem o mesmo período ao mesmo tempo.
+# É reentrante porque a gravação no banco (etapa pós-ingestão) roda dentro do download.
+_period_locks: Dict[Tuple[str, int], threading.RLock] = {}
+
+# Funções chamadas após a extração de um período: (doc_type, ano, caminho extraído)
+_ingestion_hooks: List[Callable[[str, int, str], None]] = []
+
+# A ingestão (gravação de todas as linhas no banco, diretório de empresas, agregados) leva
+# de segundos a minutos por período: roda em um único worker em segundo plano, fora do caminho
+# das requisições, que seguem usando os CSVs até o período estar gravado
+_background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cvm-ingestion")
+_background_jobs: Dict[Tuple, Future] = {}
+_background_lock = threading.Lock()
+
+# Frequência de acesso observada, usada para escolher o que pré-carregar. Incrementada pelas
+# threads das requisições e lida pelo agendador: todo acesso passa pelo lock.
+_period_access_counter: Counter = Counter()
+_access_stats_lock = threading.Lock()
+
+def register_ingestion_hook(hook: Callable[[str, int, str], None]) -> None:
+    """
+    Registra uma função a ser chamada (em segundo plano) sempre que os arquivos de um tipo/ano
+    forem extraídos. Usado para construir índices derivados (ex: diretório de empresas) durante a ingestão.
+    """
+    if hook not in _ingestion_hooks:
+        _ingestion_hooks.append(hook)
+
+def _run_ingestion_hooks(doc_type: str, year: int, extracted_path: str) -> None:
+    for hook in _ingestion_hooks:
+        try:
+            hook(doc_type, year, extracted_path)
+        except Exception as e:
+            print(f"Erro ao executar etapa pós-ingestão {getattr(hook, '__name__', hook)} para {doc_type}/{year}: {e}")
+
+def _log_background_error(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Erro em tarefa de ingestão em segundo plano: {future.exception()}")
+
+def run_in_background(key: Tuple, fn: Callable, *args) -> Future:
+    """
+    Agenda fn(*args) no worker de ingestão. Se uma tarefa com a mesma chave já estiver
+    na fila ou em execução, retorna essa tarefa em vez de agendar outra.
+    """
+    with _background_lock:
+        future = _background_jobs.get(key)
+        if future is None or future.done():
+            future = _background_executor.submit(fn, *args)
+            future.add_done_callback(_log_background_error)
+            _background_jobs[key] = future
+        return future
+
+def _ingest_period(doc_type: str, year: int, extracted_path: str = None) -> None:
+    """
+    Executa as etapas pós-ingestão de um período. Sem o caminho extraído, baixa os arquivos
+    se necessário e não faz nada se o período já estiver gravado no banco.
+    """
+    if extracted_path is None:
+        if is_period_stored(doc_type, year):
+            return
+        # Um download feito aqui não agenda outra ingestão: esta tarefa ainda está em execução
+        extracted_path = ensure_year_available(doc_type, year)
+        if not extracted_path:
+            return
+    _run_ingestion_hooks(doc_type, year, extracted_path)
+
+def schedule_ingestion(doc_type: str, year: int, extracted_path: str = None) -> Future:
+    """Agenda as etapas pós-ingestão de um período no worker em segundo plano."""
+    return run_in_background(("ingest", doc_type, year), _ingest_period, doc_type, year, extracted_path)
+
 def fetch_cvm_data(endpoint: str):
     """
     Busca dados de um endpoint específico da CVM.
@@ -87,6 +169,10 @@ def list_available_zip_files(document_type: str) -> list[str]:
         print(f"Tipo de documento inválido: {document_type}. Use 'ITR' ou 'FRE'.")
         return []
 
+    cached = _zip_listing_cache.get(document_type.upper())
+    if cached and time.time() - cached[0] < settings.CVM_LISTING_CACHE_TTL_SECONDS:
+        return list(cached[1])
+
     endpoint = f"CIA_ABERTA/DOC/{document_type.upper()}/DADOS/"
     html_content = fetch_cvm_data(endpoint)
 
@@ -106,6 +192,8 @@ def list_available_zip_files(document_type: str) -> list[str]:
     if not zip_files:
         print(f"Nenhum arquivo .zip encontrado para {document_type} em {endpoint}")
         print("Verifique a estrutura do HTML ou o endpoint.")
+    else:
+        _zip_listing_cache[document_type.upper()] = (time.time(), zip_files)
 
     return zip_files
 
@@ -158,23 +246,32 @@ def download_and_unzip_cvm_file(document_type: str, zip_file_name: str, base_ext
         with zipfile.ZipFile(BytesIO(zip_content)) as zf:
             zf.extractall(extract_to_path)
         print(f"Arquivo {zip_file_name} descompactado com sucesso em {extract_to_path}")
-        return extract_to_path
     except zipfile.BadZipFile:
         print(f"Erro: O arquivo {zip_file_name} não é um arquivo ZIP válido ou está corrompido.")
+        return None
     except OSError as e:
         print(f"Erro de OS ao criar diretórios ou extrair arquivos: {e}")
+        return None
     except Exception as e:
         print(f"Uma exceção inesperada ocorreu durante a descompactação: {e}")
-    
-    return None
+        return None
+
+    # Um novo período extraído invalida as tabelas em cache e alimenta os índices derivados
+    if year_str.isdigit():
+        with _cache_lock:
+            for cache_key in [k for k in _statements_cache if k[:2] == (document_type.upper(), int(year_str))]:
+                del _statements_cache[cache_key]
+        schedule_ingestion(document_type.upper(), int(year_str), extract_to_path)
+    return extract_to_path
 
-def read_cvm_csv(csv_file_path: str) -> pd.DataFrame | None:
+def read_cvm_csv(csv_file_path: str, usecols: List[str] = None) -> pd.DataFrame | None:
     """
     Lê um arquivo CSV da CVM e o carrega em um DataFrame pandas.
     Os arquivos da CVM usam encoding 'latin-1' e ';' como delimitador.
 
     Args:
         csv_file_path: O caminho completo para o arquivo .csv.
+        usecols: Colunas a serem lidas. Se None, lê todas.
 
     Returns:
         Um DataFrame pandas com o conteúdo do CSV ou None em caso de erro.
@@ -182,7 +279,7 @@ def read_cvm_csv(csv_file_path: str) -> pd.DataFrame | None:
     print(f"Lendo arquivo CSV: {csv_file_path}")
     try:
         # Os arquivos da CVM geralmente são delimitados por ';' e usam encoding 'latin-1'
-        df = pd.read_csv(csv_file_path, sep=';', encoding='latin-1', low_memory=False)
+        df = pd.read_csv(csv_file_path, sep=';', encoding='latin-1', low_memory=False, usecols=usecols)
         print(f"Arquivo {os.path.basename(csv_file_path)} lido com sucesso.")
         return df
     except FileNotFoundError:
@@ -193,6 +290,217 @@ def read_cvm_csv(csv_file_path: str) -> pd.DataFrame | None:
         print(f"Ocorreu um erro ao ler o arquivo CSV {csv_file_path}: {e}")
     return None
 
+def list_local_periods(base_path: str = DEFAULT_DOWNLOAD_PATH) -> List[Tuple[str, int, str]]:
+    """
+    Lista os períodos já extraídos localmente.
+
+    Returns:
+        Uma lista de tuplas (doc_type, ano, caminho do diretório).
+    """
+    periods = []
+    for doc_type in ["ITR", "FRE"]:
+        doc_path = os.path.join(base_path, doc_type)
+        if not os.path.isdir(doc_path):
+            continue
+        for year_dir in sorted(os.listdir(doc_path)):
+            if year_dir.isdigit():
+                periods.append((doc_type, int(year_dir), os.path.join(doc_path, year_dir)))
+    return periods
+
+def _get_period_lock(doc_type: str, year: int) -> threading.RLock:
+    with _cache_lock:
+        return _period_locks.setdefault((doc_type, year), threading.RLock())
+
+def ensure_year_available(doc_type: Literal["ITR", "FRE"], year: int) -> str | None:
+    """
+    Garante que os arquivos de um tipo/ano existem localmente, baixando-os se necessário.
+
+    Returns:
+        O caminho do diretório do ano ou None se não foi possível obter os arquivos.
+    """
+    year_path = os.path.join(DEFAULT_DOWNLOAD_PATH, doc_type, str(year))
+    if os.path.exists(year_path):
+        return year_path
+
+    with _get_period_lock(doc_type, year):
+        # Outra thread pode ter concluído o download enquanto esperávamos o lock
+        if os.path.exists(year_path):
+            return year_path
+
+        print(f"Dados para {doc_type}/{year} não encontrados localmente. Tentando baixar...")
+        available_files = list_available_zip_files(doc_type)
+        zip_to_download = next((f for f in available_files if str(year) in f), None)
+        if not zip_to_download:
+            print(f"Não foi possível encontrar o arquivo .zip para {doc_type}/{year} no site da CVM.")
+            return None
+
+        if not download_and_unzip_cvm_file(doc_type, zip_to_download):
+            return None
+
+    return year_path
+
+def load_statement_table(doc_type: Literal["ITR", "FRE"], year: int, stmt_key: str) -> pd.DataFrame | None:
+    """
+    Retorna a tabela completa de uma demonstração, indexada e ordenada por CNPJ_CIA.
+    As tabelas ficam em um cache LRU em memória para evitar reler o CSV a cada requisição.
+
+    Returns:
+        O DataFrame indexado por CNPJ ou None se o arquivo não existir/não puder ser lido.
+    """
+    cache_key = (doc_type, year, stmt_key)
+    with _cache_lock:
+        if cache_key in _statements_cache:
+            _statements_cache.move_to_end(cache_key)
+            return _statements_cache[cache_key]
+
+    year_path = ensure_year_available(doc_type, year)
+    if not year_path:
+        return None
+
+    csv_filename = STATEMENT_FILES_MAP[stmt_key].format(doc_type=doc_type.lower(), year=year)
+    csv_path = os.path.join(year_path, csv_filename)
+
+    if not os.path.exists(csv_path):
+        print(f"Aviso: Arquivo {csv_filename} não encontrado em {year_path}. Ignorando demonstração '{stmt_key}'.")
+        return None
+
+    with _get_period_lock(doc_type, year):
+        with _cache_lock:
+            if cache_key in _statements_cache:
+                return _statements_cache[cache_key]
+
+        full_df = read_cvm_csv(csv_path)
+        if full_df is None:
+            return None
+
+        # Índice ordenado por CNPJ: a busca de uma empresa deixa de ser uma varredura completa
+        indexed_df = full_df.set_index('CNPJ_CIA', drop=False).sort_index()
+
+        with _cache_lock:
+            _statements_cache[cache_key] = indexed_df
+            while len(_statements_cache) > settings.STATEMENTS_CACHE_MAX_TABLES:
+                _statements_cache.popitem(last=False)
+
+    return indexed_df
+
+def store_period(doc_type: str, year: int, extracted_path: str) -> int:
+    """
+    Grava no banco todas as linhas das demonstrações de um período extraído, substituindo
+    as anteriores. Registrada como etapa pós-ingestão. A gravação é feita em lotes curtos,
+    sob o lock do período: outras escritas no banco seguem possíveis durante a ingestão.
+
+    Returns:
+        O número de linhas gravadas.
+    """
+    if not settings.STATEMENT_STORE_ENABLED:
+        return 0
+
+    statement_dfs = {}
+    for stmt_key, file_pattern in STATEMENT_FILES_MAP.items():
+        csv_path = os.path.join(extracted_path, file_pattern.format(doc_type=doc_type.lower(), year=year))
+        if not os.path.exists(csv_path):
+            continue
+        df = read_cvm_csv(csv_path)
+        if df is not None:
+            statement_dfs[stmt_key] = df
+
+    if not statement_dfs:
+        print(f"Nenhuma demonstração encontrada para gravar no banco em {doc_type}/{year}.")
+        return 0
+
+    with _get_period_lock(doc_type, year), SessionLocal() as db:
+        row_count = crud.replace_period_statements(db, doc_type, year, statement_dfs)
+    print(f"Período {doc_type}/{year} gravado no banco: {row_count} linhas.")
+    return row_count
+
+def is_period_stored(doc_type: str, year: int) -> bool:
+    """Indica se o período já está completamente gravado no banco."""
+    if not settings.STATEMENT_STORE_ENABLED:
+        return False
+    with SessionLocal() as db:
+        return crud.is_period_stored(db, doc_type, year)
+
+def ensure_period_stored(doc_type: Literal["ITR", "FRE"], year: int, wait: bool = True) -> bool:
+    """
+    Garante que um período está gravado no banco, agendando o download e/ou a gravação no
+    worker em segundo plano se necessário.
+
+    Args:
+        wait: Se False (requisições), apenas agenda a gravação e retorna sem esperá-la.
+
+    Returns:
+        True se o período pode ser consultado no banco.
+    """
+    if not settings.STATEMENT_STORE_ENABLED:
+        return False
+    if is_period_stored(doc_type, year):
+        return True
+
+    future = schedule_ingestion(doc_type, year)
+    if not wait:
+        return False
+    future.result()
+    return is_period_stored(doc_type, year)
+
+def preload_period(doc_type: Literal["ITR", "FRE"], year: int, statements: List[str] = None) -> bool:
+    """
+    Deixa um tipo/ano pronto para consulta: gravado no banco ou, com o banco desativado,
+    lido e indexado em memória.
+
+    Returns:
+        True se o período foi carregado.
+    """
+    if ensure_period_stored(doc_type, year):
+        print(f"Pré-carregamento de {doc_type}/{year}: período disponível no banco.")
+        return True
+
+    loaded = 0
+    for stmt_key in statements or list(STATEMENT_FILES_MAP.keys()):
+        if stmt_key not in STATEMENT_FILES_MAP:
+            print(f"Aviso: Demonstração '{stmt_key}' não é conhecida. Ignorando.")
+            continue
+        if load_statement_table(doc_type, year, stmt_key) is not None:
+            loaded += 1
+    print(f"Pré-carregamento de {doc_type}/{year}: {loaded} demonstração(ões) em memória.")
+    return loaded > 0
+
+def get_most_requested_periods(n: int) -> List[Tuple[str, int]]:
+    """Retorna os n pares (doc_type, ano) mais acessados."""
+    with _access_stats_lock:
+        return [period for period, _ in _period_access_counter.most_common(n)]
+
+def save_access_stats(path: str = None) -> None:
+    """Persiste as estatísticas de acesso em JSON para serem usadas após uma reinicialização."""
+    path = path or settings.ACCESS_STATS_PATH
+    with _access_stats_lock:
+        data = {
+            "periods": [[doc_type, year, count] for (doc_type, year), count in _period_access_counter.items()],
+        }
+    # O agendador e o shutdown podem salvar ao mesmo tempo: cada um grava um arquivo temporário
+    # próprio e o renomeia, de modo que o JSON nunca fica pela metade
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Não foi possível salvar as estatísticas de acesso em {path}: {e}")
+
+def load_access_stats(path: str = None) -> None:
+    """Carrega as estatísticas de acesso persistidas por save_access_stats, se existirem."""
+    path = path or settings.ACCESS_STATS_PATH
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        with _access_stats_lock:
+            for doc_type, year, count in data.get("periods", []):
+                _period_access_counter[(doc_type, int(year))] += count
+    except (OSError, ValueError) as e:
+        print(f"Não foi possível carregar as estatísticas de acesso de {path}: {e}")
+
 def get_financial_statements(
     doc_type: Literal["ITR", "FRE"],
     year: int,
@@ -214,26 +522,31 @@ def get_financial_statements(
         e os valores são os DataFrames do pandas com os dados da empresa.
     """
     print(f"Buscando demonstrações para CNPJ {cnpj}, Ano {year}, Tipo {doc_type}")
-
-    # Garante que os arquivos para o ano/tipo existem, se não, baixa-os.
-    doc_type_lower = doc_type.lower()
-    year_path = os.path.join(DEFAULT_DOWNLOAD_PATH, doc_type, str(year))
-    if not os.path.exists(year_path):
-        print(f"Dados para {doc_type}/{year} não encontrados localmente. Tentando baixar...")
-        # Lógica para encontrar o nome do zip e baixar (simplificado por enquanto)
-        available_files = list_available_zip_files(doc_type)
-        zip_to_download = next((f for f in available_files if str(year) in f), None)
-        if not zip_to_download:
-            print(f"Não foi possível encontrar o arquivo .zip para {doc_type}/{year} no site da CVM.")
-            return {}
-        
-        download_and_unzip_cvm_file(doc_type, zip_to_download)
+    # Frequência usada para escolher os períodos do pré-carregamento
+    with _access_stats_lock:
+        _period_access_counter[(doc_type, year)] += 1
 
     if statements is None:
         statements_to_fetch = list(STATEMENT_FILES_MAP.keys())
     else:
         statements_to_fetch = statements
 
+    # Com o período gravado no banco, a busca usa o índice (cnpj, doc_type, year, statement).
+    # Senão, a gravação é agendada em segundo plano e esta requisição usa os CSVs.
+    if ensure_period_stored(doc_type, year, wait=False):
+        with SessionLocal() as db:
+            company_statements = crud.get_company_statements(db, cnpj, doc_type, year, statements_to_fetch)
+        for stmt_key in statements_to_fetch:
+            if stmt_key not in STATEMENT_FILES_MAP:
+                print(f"Aviso: Demonstração '{stmt_key}' não é conhecida. Ignorando.")
+            elif stmt_key not in company_statements:
+                print(f"Nenhum dado encontrado para o CNPJ {cnpj} em {stmt_key} de {doc_type}/{year}.")
+        return company_statements
+
+    # Garante que os arquivos para o ano/tipo existem, se não, baixa-os.
+    if not ensure_year_available(doc_type, year):
+        return {}
+
     company_statements = {}
 
     for stmt_key in statements_to_fetch:
@@ -241,26 +554,17 @@ def get_financial_statements(
             print(f"Aviso: Demonstração '{stmt_key}' não é conhecida. Ignorando.")
             continue
 
-        file_pattern = STATEMENT_FILES_MAP[stmt_key]
-        csv_filename = file_pattern.format(doc_type=doc_type_lower, year=year)
-        csv_path = os.path.join(year_path, csv_filename)
-
-        if not os.path.exists(csv_path):
-            print(f"Aviso: Arquivo {csv_filename} não encontrado em {year_path}. Ignorando demonstração '{stmt_key}'.")
-            continue
-
-        # Ler o CSV completo
-        full_df = read_cvm_csv(csv_path)
+        # Tabela completa, lida do cache em memória quando disponível
+        full_df = load_statement_table(doc_type, year, stmt_key)
         if full_df is None:
             continue
 
-        # Filtrar pelo CNPJ da empresa
+        # Filtrar pelo CNPJ da empresa usando o índice da tabela
         # O CNPJ do usuário (validado pela API) é comparado diretamente com a coluna do CSV.
-        company_df = full_df[full_df['CNPJ_CIA'] == cnpj].copy()
-        
-        if company_df.empty:
-            print(f"Nenhum dado encontrado para o CNPJ {cnpj} no arquivo {csv_filename}.")
+        if cnpj not in full_df.index:
+            print(f"Nenhum dado encontrado para o CNPJ {cnpj} em {stmt_key} de {doc_type}/{year}.")
             continue
+        company_df = full_df.loc[[cnpj]].reset_index(drop=True)
 
         # TODO: Adicionar lógica mais sofisticada de filtragem
         # - Pegar a última VERSAO
@@ -272,6 +576,9 @@ def get_financial_statements(
 
     return company_statements
 
+# A gravação no banco é a primeira etapa pós-ingestão: as demais podem ler o período já gravado
+register_ingestion_hook(store_period)
+
 # Exemplo de como poderia ser usado (para teste local):
 # if __name__ == '__main__':
 #     # Teste 1: Listar arquivos ITR
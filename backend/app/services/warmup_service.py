@@ -0,0 +1,93 @@
+# Lógica de aquecimento do cache na inicialização da aplicação.
+# - Pré-carregar (baixar, ler e indexar) os períodos mais requisitados.
+# - Agendar o pré-carregamento periódico em segundo plano, sem bloquear a API.
+
+import threading
+import time
+from typing import List, Tuple
+from app.core.config import settings
+from app.services import aggregation_service, company_service, cvm_service
+
+_stop_event = threading.Event()
+_scheduler_thread: threading.Thread | None = None
+
+def _parse_targets(targets: List[str]) -> List[Tuple[str, int]]:
+    """
+    Converte entradas no formato "TIPO:ANO" (ex: "ITR:2024") em pares (doc_type, ano).
+    Entradas inválidas são ignoradas.
+    """
+    periods = []
+    for target in targets:
+        doc_type, _, year = target.partition(":")
+        doc_type = doc_type.strip().upper()
+        if doc_type not in ["ITR", "FRE"] or not year.strip().isdigit():
+            print(f"Aviso: Alvo de pré-carregamento inválido '{target}'. Use o formato 'ITR:2024'.")
+            continue
+        periods.append((doc_type, int(year)))
+    return periods
+
+def select_periods() -> List[Tuple[str, int]]:
+    """Combina os períodos configurados com os mais acessados, sem repetições."""
+    periods = _parse_targets(settings.WARMUP_TARGETS)
+    for period in cvm_service.get_most_requested_periods(settings.WARMUP_TOP_PERIODS):
+        if period not in periods:
+            periods.append(period)
+    return periods
+
+def run_warmup() -> None:
+    """
+    Executa um ciclo de pré-carregamento: download, gravação/indexação e agregados
+    de cada período selecionado.
+    """
+    periods = select_periods()
+    if not periods:
+        print("Pré-carregamento: nenhum período configurado ou observado.")
+        return
+
+    print(f"Pré-carregamento iniciado para {len(periods)} período(s).")
+    for doc_type, year in periods:
+        if _stop_event.is_set():
+            return
+        try:
+            cvm_service.preload_period(doc_type, year)
+            aggregation_service.ensure_period_aggregated(doc_type, year, wait=True)
+        except Exception as e:
+            print(f"Erro ao pré-carregar {doc_type}/{year}: {e}")
+
+    cvm_service.save_access_stats()
+    print("Pré-carregamento concluído.")
+
+def _scheduler_loop() -> None:
+    # Primeira execução imediata (aquecimento de inicialização), depois a cada intervalo.
+    # As estatísticas de acesso são salvas com mais frequência, para não se perderem
+    # se o processo for encerrado sem passar pelo shutdown.
+    run_warmup()
+    interval = settings.WARMUP_INTERVAL_SECONDS
+    next_warmup = time.monotonic() + interval
+    while not _stop_event.wait(settings.ACCESS_STATS_SAVE_INTERVAL_SECONDS):
+        try:
+            cvm_service.save_access_stats()
+            if interval > 0 and time.monotonic() >= next_warmup:
+                next_warmup = time.monotonic() + interval
+                # Na inicialização quem atualiza os dados cadastrais é o company_service.start
+                company_service.refresh_reference_data()
+                run_warmup()
+        except Exception as e:
+            # Um erro em um ciclo não pode encerrar o agendador
+            print(f"Erro no ciclo do agendador de pré-carregamento: {e}")
+
+def start() -> None:
+    """Inicia o aquecimento e o agendador em uma thread em segundo plano."""
+    global _scheduler_thread
+    if not settings.WARMUP_ENABLED or (_scheduler_thread and _scheduler_thread.is_alive()):
+        return
+
+    cvm_service.load_access_stats()
+    _stop_event.clear()
+    _scheduler_thread = threading.Thread(target=_scheduler_loop, name="cvm-warmup", daemon=True)
+    _scheduler_thread.start()
+
+def stop() -> None:
+    """Sinaliza a parada do agendador e persiste as estatísticas de acesso."""
+    _stop_event.set()
+    cvm_service.save_access_stats()
@@ -0,0 +1,23 @@
+import re
+import unicodedata
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza um texto para busca: remove acentos, converte para maiúsculas e
+    substitui pontuação por espaços (ex: "Petróleo Brasileiro S.A." -> "PETROLEO BRASILEIRO S A").
+    """
+    if not text:
+        return ""
+    without_accents = "".join(
+        c for c in unicodedata.normalize("NFKD", str(text)) if not unicodedata.combining(c)
+    )
+    return " ".join(re.sub(r"[^0-9A-Za-z]+", " ", without_accents).upper().split())
+
+def cnpj_digits(cnpj: str) -> str:
+    """Retorna apenas os dígitos de um CNPJ (ex: "33.000.167/0001-01" -> "33000167000101")."""
+    return re.sub(r"\D", "", str(cnpj or ""))
+
+def format_cnpj(digits: str) -> str:
+    """Formata um CNPJ de 14 dígitos no padrão XX.XXX.XXX/XXXX-XX."""
+    digits = cnpj_digits(digits).zfill(14)
+    return f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+# As configurações exigem a chave do Gemini; nos testes a IA nunca é chamada de verdade.
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+os.environ.setdefault("COMPANY_CADASTRO_ENABLED", "false")
+# Arquivos gravados pela aplicação (banco, diretório de empresas, estatísticas) ficam fora de data/
+_data_dir = tempfile.mkdtemp(prefix="analise-fundamentalista-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_data_dir, 'test.db')}"
+os.environ["COMPANY_INDEX_PATH"] = os.path.join(_data_dir, "company_index.json")
+os.environ["ACCESS_STATS_PATH"] = os.path.join(_data_dir, "access_stats.json")
+
+# Permite "import app" ao rodar o pytest a partir da pasta backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sessões de um banco SQLite temporário, com todas as tabelas criadas."""
+    from app import models  # noqa: F401
+    from app.core.database import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    engine.dispose()
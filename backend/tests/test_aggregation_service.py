@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from app import crud
+from app.services import aggregation_service, company_service
+from app.utils.formatters import cnpj_digits
+
+A, B, C = "33.000.167/0001-01", "33.592.510/0001-54", "00.000.000/0001-91"
+
+# Descrições do plano de contas de empresas comerciais e industriais
+DESCRIPTIONS = {
+    ("DRE", "3.01"): "Receita de Venda de Bens e/ou Serviços",
+    ("DRE", "3.03"): "Resultado Bruto",
+    ("DRE", "3.11"): "Lucro/Prejuízo Consolidado do Período",
+    ("BPA", "1"): "Ativo Total",
+    ("BPP", "2.01"): "Passivo Circulante",
+    ("BPP", "2.02"): "Passivo Não Circulante",
+    ("BPP", "2.03"): "Patrimônio Líquido Consolidado",
+}
+
+def _row(cnpj, statement, cd_conta, value, dt_refer="2024-09-30", dt_ini=None, ordem="ÚLTIMO", versao=1, escala="MIL", ds_conta=None):
+    return {
+        "cnpj": cnpj, "statement": statement, "cd_conta": cd_conta,
+        "ds_conta": ds_conta or DESCRIPTIONS[(statement, cd_conta)], "vl_conta": value, "escala_moeda": escala,
+        "versao": versao, "ordem_exerc": ordem, "dt_refer": dt_refer,
+        "dt_ini_exerc": dt_ini, "dt_fim_exerc": None if ordem != "ÚLTIMO" else dt_refer,
+    }
+
+def test_latest_account_values_picks_current_ytd_latest_version_and_scales():
+    rows = pd.DataFrame([
+        _row(A, "DRE", "3.01", 90.0, dt_ini="2024-01-01"),
+        _row(A, "DRE", "3.01", 30.0, dt_ini="2024-07-01"),
+        _row(A, "DRE", "3.01", 80.0, dt_ini="2023-01-01", ordem="PENÚLTIMO"),
+        _row(A, "BPA", "1", 500.0, versao=1),
+        _row(A, "BPA", "1", 600.0, versao=2),
+        _row(B, "BPA", "1", 7.0, escala="UNIDADE"),
+    ])
+
+    accounts = aggregation_service._latest_account_values(rows)
+
+    assert list(accounts.columns) == list(aggregation_service.METRIC_ACCOUNTS)
+    assert accounts.loc[A, "receita_liquida"] == 90_000.0
+    assert accounts.loc[A, "ativo_total"] == 600_000.0
+    assert accounts.loc[B, "ativo_total"] == 7.0
+    assert np.isnan(accounts.loc[B, "receita_liquida"])
+
+def test_latest_account_values_uses_a_common_reference_date():
+    # A e B já entregaram o 3º trimestre; C só o 2º. Os acumulados de 6 e 9 meses não se misturam.
+    rows = pd.DataFrame([
+        _row(A, "DRE", "3.01", 90.0, dt_ini="2024-01-01"),
+        _row(B, "DRE", "3.01", 60.0, dt_ini="2024-01-01"),
+        _row(C, "DRE", "3.01", 40.0, dt_ini="2024-01-01", dt_refer="2024-06-30"),
+        _row(A, "DRE", "3.01", 50.0, dt_ini="2024-01-01", dt_refer="2024-06-30"),
+    ])
+
+    accounts = aggregation_service._latest_account_values(rows)
+
+    assert sorted(accounts.index) == sorted([A, B])
+    assert accounts.loc[A, "receita_liquida"] == 90_000.0
+
+def test_latest_account_values_leaves_out_companies_with_another_chart_of_accounts():
+    # Em bancos, 2.03 é "Provisões" e 3.01 são as receitas da intermediação financeira
+    rows = pd.DataFrame([
+        _row(A, "BPP", "2.03", 400.0),
+        _row(A, "DRE", "3.01", 200.0, dt_ini="2024-01-01"),
+        _row(C, "BPA", "1", 9000.0),
+        _row(C, "BPP", "2.03", 50.0, ds_conta="Provisões"),
+        _row(C, "DRE", "3.01", 700.0, dt_ini="2024-01-01", ds_conta="Receitas da Intermediação Financeira"),
+    ])
+
+    accounts = aggregation_service._latest_account_values(rows)
+
+    assert list(accounts.index) == [A]
+    assert accounts.loc[A, "patrimonio_liquido"] == 400_000.0
+
+def test_reference_date_requires_coverage_of_half_the_companies():
+    rows = pd.DataFrame([
+        _row(A, "BPA", "1", 1.0, dt_refer="2024-09-30"),
+        _row(A, "BPA", "1", 1.0, dt_refer="2024-06-30"),
+        _row(B, "BPA", "1", 1.0, dt_refer="2024-06-30"),
+        _row(C, "BPA", "1", 1.0, dt_refer="2024-06-30"),
+    ])
+    assert aggregation_service._reference_date(rows) == "2024-06-30"
+
+def test_compute_company_metrics_ratios_and_invalid_denominators():
+    accounts = pd.DataFrame({
+        "receita_liquida": [200.0, 0.0],
+        "lucro_bruto": [80.0, 10.0],
+        "lucro_liquido": [20.0, 5.0],
+        "ativo_total": [1000.0, 50.0],
+        "passivo_circulante": [100.0, 10.0],
+        "passivo_nao_circulante": [np.nan, 10.0],
+        "patrimonio_liquido": [400.0, -20.0],
+    }, index=[A, B])
+
+    metrics = aggregation_service.compute_company_metrics(accounts)
+
+    assert list(metrics.columns) == aggregation_service.METRICS
+    assert metrics.loc[A, "margem_bruta"] == 0.4
+    assert metrics.loc[A, "margem_liquida"] == 0.1
+    assert metrics.loc[A, "roe"] == 0.05
+    assert metrics.loc[A, "passivo_sobre_pl"] == 0.25
+    # Receita zero e patrimônio líquido negativo não geram índices
+    assert metrics.loc[B, ["margem_bruta", "margem_liquida", "roe", "passivo_sobre_pl"]].isna().all()
+
+def test_sector_aggregates_are_recomputed_after_the_cadastro_is_loaded(monkeypatch, session_factory):
+    monkeypatch.setattr(aggregation_service, "SessionLocal", session_factory)
+    monkeypatch.setattr(company_service, "_companies", {})
+    statements = pd.DataFrame([
+        {"CNPJ_CIA": cnpj, "DT_REFER": "2024-09-30", "VERSAO": 1, "CD_CONTA": "1", "VL_CONTA": value,
+         "DS_CONTA": "Ativo Total", "ESCALA_MOEDA": "MIL", "ORDEM_EXERC": "ÚLTIMO", "DT_FIM_EXERC": "2024-09-30"}
+        for cnpj, value in ((A, 10.0), (B, 30.0))
+    ])
+    with session_factory() as db:
+        crud.replace_period_statements(db, "ITR", 2024, {"BPA": statements})
+
+    # Sem cadastro, só há agregados de mercado
+    aggregation_service.aggregate_period("ITR", 2024)
+    assert aggregation_service.get_peer_context(A, "ITR", 2024)["sector_available"] is False
+    assert aggregation_service.refresh_sector_aggregates() == 0
+
+    for cnpj in (A, B):
+        company = company_service._new_company(cnpj_digits(cnpj))
+        company["sector"] = "Petróleo e Gás"
+        company_service._companies[cnpj_digits(cnpj)] = company
+
+    assert aggregation_service.refresh_sector_aggregates() == 1
+    peer_context = aggregation_service.get_peer_context(A, "ITR", 2024)
+    assert peer_context["sector_available"] is True
+    assert peer_context["metrics"]["ativo_total"]["sector"]["count"] == 2
+    assert set(aggregation_service.get_period_aggregates("ITR", 2024)) == {"mercado", "Petróleo e Gás"}
+    # Setores inalterados não disparam novo cálculo
+    assert aggregation_service.refresh_sector_aggregates() == 0
+
+def test_ensure_period_aggregated_only_schedules_work_for_requests(monkeypatch, session_factory):
+    monkeypatch.setattr(aggregation_service, "SessionLocal", session_factory)
+    monkeypatch.setattr(aggregation_service.cvm_service, "SessionLocal", session_factory)
+    scheduled = []
+    monkeypatch.setattr(aggregation_service.cvm_service, "schedule_ingestion", lambda doc_type, year: scheduled.append((doc_type, year)))
+
+    assert aggregation_service.ensure_period_aggregated("ITR", 2024) is False
+    assert scheduled == [("ITR", 2024)]
@@ -0,0 +1,120 @@
+import json
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from app.services import ai_service
+
+class EmptyChunk:
+    """Pedaço sem partes, como o último do Gemini: acessar `.text` lança ValueError."""
+
+    @property
+    def text(self):
+        raise ValueError("The `response.text` quick accessor only works when the response contains a valid `Part`")
+
+def _stub_gemini(monkeypatch, text: str, chunk_size: int = 7, trailing_chunks=()):
+    chunks = [SimpleNamespace(text=text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    chunks += list(trailing_chunks)
+
+    class FakeModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, prompt, stream=False, **kwargs):
+            assert stream
+            return iter(chunks)
+
+    monkeypatch.setattr(ai_service.genai, "GenerativeModel", FakeModel)
+
+def _run(financial_data=None):
+    events = list(ai_service.stream_financial_analysis(financial_data or {"DRE": []}))
+    report = "".join(data for event, data in events if event == "report_chunk")
+    return report, events
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 7, len(ai_service.SUMMARY_MARKER), 1000])
+def test_stream_splits_report_and_summary_at_marker(monkeypatch, chunk_size):
+    text = (
+        "Relatório **bom**.\nFim.\n"
+        + ai_service.SUMMARY_MARKER
+        + '\n```json\n{"Receita Liquida": 10, "Lucro Liquido": "5"}\n```'
+    )
+    _stub_gemini(monkeypatch, text, chunk_size)
+
+    report, events = _run()
+
+    assert report == "Relatório **bom**.\nFim.\n"
+    assert ai_service.SUMMARY_MARKER not in report
+    assert events[-1] == ("financial_summary", {
+        "Receita Liquida": 10.0,
+        "Lucro Bruto": 0.0,
+        "Lucro Liquido": 5.0,
+        "Ativo Total": 0.0,
+        "Passivo Total": 0.0,
+        "Patrimonio Liquido": 0.0,
+    })
+
+def test_stream_accepts_text_after_summary_json(monkeypatch):
+    _stub_gemini(monkeypatch, "Texto." + ai_service.SUMMARY_MARKER + '{"Ativo Total": 3}\nObrigado.')
+
+    report, events = _run()
+
+    assert report == "Texto."
+    assert events[-1][0] == "financial_summary"
+    assert events[-1][1]["Ativo Total"] == 3.0
+
+def test_stream_ignores_final_chunk_without_parts(monkeypatch):
+    _stub_gemini(
+        monkeypatch, "Texto." + ai_service.SUMMARY_MARKER + '{"Ativo Total": 3}',
+        chunk_size=1000, trailing_chunks=[EmptyChunk()]
+    )
+
+    report, events = _run()
+
+    assert report == "Texto."
+    assert [event for event, _ in events] == ["report_chunk", "financial_summary"]
+    assert events[-1][1]["Ativo Total"] == 3.0
+
+def test_stream_keeps_summary_when_stream_fails_after_it(monkeypatch):
+    class FailingChunk:
+        @property
+        def text(self):
+            raise RuntimeError("conexão encerrada")
+
+    _stub_gemini(
+        monkeypatch, "Texto." + ai_service.SUMMARY_MARKER + '{"Ativo Total": 3}',
+        trailing_chunks=[FailingChunk()]
+    )
+
+    _, events = _run()
+
+    assert events[-1][0] == "financial_summary"
+
+def test_stream_without_marker_emits_whole_report_and_error(monkeypatch):
+    _stub_gemini(monkeypatch, "Só texto, sem resumo ###")
+
+    report, events = _run()
+
+    assert report == "Só texto, sem resumo ###"
+    assert events[-1][0] == "error"
+
+def test_stream_with_invalid_summary_emits_error(monkeypatch):
+    _stub_gemini(monkeypatch, "Texto." + ai_service.SUMMARY_MARKER + '{"Ativo Total": "muito"}')
+
+    _, events = _run()
+
+    assert events[-1][0] == "error"
+
+def test_prepare_financial_data_turns_empty_values_into_null():
+    dre = pd.DataFrame({
+        "CD_CONTA": ["3.01", "3.02"],
+        "DS_CONTA": ["Receita", "Custo"],
+        "VL_CONTA": [10.0, np.nan],
+        "VERSAO": [1, 1],
+        "DT_FIM_EXERC": ["2024-09-30", "2024-09-30"],
+    })
+
+    financial_data = ai_service.prepare_financial_data({"DRE": dre})
+
+    assert financial_data == {"DRE": [{"DS_CONTA": "Receita", "VL_CONTA": 10.0}, {"DS_CONTA": "Custo", "VL_CONTA": None}]}
+    # Sem NaN, o texto é JSON estrito (JSON.parse no navegador)
+    json.dumps(financial_data, allow_nan=False)
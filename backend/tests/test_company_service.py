@@ -0,0 +1,86 @@
+import zipfile
+from io import BytesIO
+import pytest
+from app.services import company_service
+
+COMPANIES = {
+    "33000167000101": ("PETRÓLEO BRASILEIRO S.A. - PETROBRAS", {"ITR": [2024]}),
+    "33592510000154": ("VALE S.A.", {"ITR": [2023, 2024]}),
+    "00000000000191": ("BANCO DO BRASIL S.A.", {"ITR": [2024]}),
+    "60746948000112": ("BANCO BRADESCO S.A.", {}),
+}
+
+@pytest.fixture(autouse=True)
+def directory(monkeypatch, tmp_path):
+    monkeypatch.setattr(company_service, "_companies", {})
+    monkeypatch.setattr(company_service.settings, "COMPANY_INDEX_PATH", str(tmp_path / "company_index.json"))
+    for digits, (name, years) in COMPANIES.items():
+        company = company_service._new_company(digits)
+        company.update(name=name, years=years)
+        company_service._companies[digits] = company
+    company_service._rebuild_search_keys()
+
+def _cnpjs(query, limit=10):
+    return [company["cnpj"] for company in company_service.search_companies(query, limit)]
+
+def test_search_is_accent_and_case_insensitive_prefix():
+    assert _cnpjs("petró") == ["33.000.167/0001-01"]
+    assert _cnpjs("Petro") == ["33.000.167/0001-01"]
+
+def test_search_matches_prefix_of_any_word():
+    # "BRASILEIRO" e "BRASIL" casam com o prefixo; nenhum nome começa com ele, então a ordem é alfabética
+    assert _cnpjs("brasil") == ["00.000.000/0001-91", "33.000.167/0001-01"]
+    assert _cnpjs("petrobr") == ["33.000.167/0001-01"]
+
+def test_search_ranks_name_prefix_first_and_respects_limit():
+    assert _cnpjs("banco") == ["00.000.000/0001-91", "60.746.948/0001-12"]
+    assert len(_cnpjs("banco", limit=1)) == 1
+
+def test_search_by_cnpj_digits_formatted_or_not():
+    assert _cnpjs("33.592") == ["33.592.510/0001-54"]
+    assert _cnpjs("33592510") == ["33.592.510/0001-54"]
+    assert _cnpjs("33") == ["33.000.167/0001-01", "33.592.510/0001-54"]
+
+def test_search_without_match_or_empty_query():
+    assert _cnpjs("xyz") == []
+    assert _cnpjs("  ") == []
+
+def test_get_company_accepts_digits_or_formatted():
+    assert company_service.get_company("33.592.510/0001-54")["name"] == "VALE S.A."
+    assert company_service.get_company("33592510000154")["name"] == "VALE S.A."
+
+def test_refresh_tickers_downloads_fca_and_replaces_tickers(monkeypatch):
+    csv = "CNPJ_Companhia;Codigo_Negociacao\n33.000.167/0001-01;PETR4\n33.000.167/0001-01;PETR3\n33.592.510/0001-54;VALE3\n"
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("fca_cia_aberta_valor_mobiliario_2024.csv", csv.encode("latin-1"))
+    requested = []
+
+    def fake_download(segment):
+        requested.append(segment)
+        return buffer.getvalue()
+
+    monkeypatch.setattr(company_service.cvm_service, "download_cvm_file", fake_download)
+    company_service._companies["33000167000101"]["tickers"] = ["PETR5"]
+
+    assert company_service.refresh_tickers(2024) == 2
+    assert requested == ["CIA_ABERTA/DOC/FCA/DADOS/fca_cia_aberta_2024.zip"]
+    assert company_service.get_company("33000167000101")["tickers"] == ["PETR3", "PETR4"]
+    assert _cnpjs("petr4") == ["33.000.167/0001-01"]
+    assert _cnpjs("vale3") == ["33.592.510/0001-54"]
+
+def test_refresh_cadastro_prefers_active_registration(monkeypatch):
+    # O registro ativo aparece antes do cancelado: não pode ser sobrescrito por ele
+    csv = (
+        "CNPJ_CIA;DENOM_SOCIAL;DENOM_COMERC;CD_CVM;SETOR_ATIV;SIT\n"
+        "33.592.510/0001-54;VALE S.A.;VALE;4170;Extração Mineral;ATIVO\n"
+        "33.592.510/0001-54;CIA VALE DO RIO DOCE;;999;Outros;CANCELADA\n"
+        "11.111.111/0001-11;EMPRESA CANCELADA S.A.;;123;Outros;CANCELADA\n"
+    )
+    monkeypatch.setattr(company_service.cvm_service, "download_cvm_file", lambda segment: csv.encode("latin-1"))
+
+    assert company_service.refresh_cadastro(save=False) == 3
+
+    vale = company_service.get_company("33592510000154")
+    assert (vale["name"], vale["cd_cvm"], vale["sector"], vale["status"]) == ("VALE S.A.", 4170, "Extração Mineral", "ATIVO")
+    assert company_service.get_company("11111111000111") is None
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+import pandas as pd
+import pytest
+from app import crud
+from app.services import cvm_service
+
+CNPJ = "33.000.167/0001-01"
+OTHER_CNPJ = "33.592.510/0001-54"
+
+def _common(cnpj):
+    return {
+        "CNPJ_CIA": cnpj, "DT_REFER": "2024-09-30", "VERSAO": 1, "DENOM_CIA": "EMPRESA", "CD_CVM": 9512,
+        "GRUPO_DFP": "DF Consolidado - Balanço Patrimonial Ativo", "MOEDA": "REAL", "ESCALA_MOEDA": "MIL",
+        "ORDEM_EXERC": "ÚLTIMO",
+    }
+
+def _write_period(base_path, year=2024):
+    year_path = base_path / "ITR" / str(year)
+    year_path.mkdir(parents=True)
+    bpa, dre = [], []
+    for cnpj in (CNPJ, OTHER_CNPJ):
+        # BPA não tem DT_INI_EXERC; a DRE tem. ST_CONTA_FIXA vazia vira NaN na leitura do CSV.
+        bpa += [
+            {**_common(cnpj), "DT_FIM_EXERC": "2024-09-30", "CD_CONTA": "1", "DS_CONTA": "Ativo Total", "VL_CONTA": 100.5, "ST_CONTA_FIXA": "S"},
+            {**_common(cnpj), "DT_FIM_EXERC": "2024-09-30", "CD_CONTA": "1.01", "DS_CONTA": "Ativo Circulante", "VL_CONTA": None, "ST_CONTA_FIXA": None},
+            {**_common(cnpj), "DT_FIM_EXERC": "2024-09-30", "CD_CONTA": "1.01.01", "DS_CONTA": "Caixa", "VL_CONTA": 7.0, "ST_CONTA_FIXA": "S"},
+        ]
+        dre += [
+            {**_common(cnpj), "DT_INI_EXERC": "2024-01-01", "DT_FIM_EXERC": "2024-09-30", "CD_CONTA": "3.01", "DS_CONTA": "Receita", "VL_CONTA": 10.0, "ST_CONTA_FIXA": "S"},
+            {**_common(cnpj), "DT_INI_EXERC": "2024-07-01", "DT_FIM_EXERC": "2024-09-30", "CD_CONTA": "3.01", "DS_CONTA": "Receita", "VL_CONTA": 4.0, "ST_CONTA_FIXA": "S"},
+            {**_common(cnpj), "DT_INI_EXERC": "2024-01-01", "DT_FIM_EXERC": "2024-09-30", "CD_CONTA": "3.04.01", "DS_CONTA": "Despesas com Vendas", "VL_CONTA": -2.0, "ST_CONTA_FIXA": "N"},
+        ]
+    for name, rows in (("BPA", bpa), ("DRE", dre)):
+        pd.DataFrame(rows).to_csv(year_path / f"itr_cia_aberta_{name}_con_{year}.csv", sep=";", encoding="latin-1", index=False)
+    return year_path
+
+@pytest.fixture
+def cvm_tmp(monkeypatch, tmp_path, session_factory):
+    monkeypatch.setattr(cvm_service, "DEFAULT_DOWNLOAD_PATH", str(tmp_path / "raw"))
+    monkeypatch.setattr(cvm_service, "SessionLocal", session_factory)
+    monkeypatch.setattr(cvm_service, "_statements_cache", OrderedDict())
+    # Só a gravação no banco: as demais etapas pós-ingestão têm testes próprios
+    monkeypatch.setattr(cvm_service, "_ingestion_hooks", [cvm_service.store_period])
+    return _write_period(tmp_path / "raw")
+
+def test_store_round_trip_matches_csv_path(monkeypatch, cvm_tmp, session_factory):
+    monkeypatch.setattr(cvm_service.settings, "STATEMENT_STORE_ENABLED", False)
+    from_csv = cvm_service.get_financial_statements("ITR", 2024, CNPJ)
+
+    monkeypatch.setattr(cvm_service.settings, "STATEMENT_STORE_ENABLED", True)
+    monkeypatch.setattr(cvm_service, "_background_jobs", {})
+    # Período ainda não gravado: a requisição usa os CSVs e agenda a gravação em segundo plano
+    assert cvm_service.get_financial_statements("ITR", 2024, CNPJ).keys() == from_csv.keys()
+    cvm_service._background_jobs[("ingest", "ITR", 2024)].result()
+
+    with session_factory() as db:
+        assert crud.is_period_stored(db, "ITR", 2024)
+    from_store = cvm_service.get_financial_statements("ITR", 2024, CNPJ)
+
+    assert set(from_store) == set(from_csv) == {"BPA", "DRE"}
+    for statement in from_csv:
+        assert list(from_store[statement].columns) == list(from_csv[statement].columns)
+        pd.testing.assert_frame_equal(from_store[statement], from_csv[statement], check_dtype=False)
+    assert "GRUPO_DFP" in from_store["BPA"].columns
+    assert "DT_INI_EXERC" not in from_store["BPA"].columns
+
+def test_replace_period_statements_in_batches_replaces_previous_rows(cvm_tmp, session_factory):
+    statement_dfs = {"BPA": cvm_service.read_cvm_csv(str(cvm_tmp / "itr_cia_aberta_BPA_con_2024.csv"))}
+
+    with session_factory() as db:
+        assert crud.replace_period_statements(db, "ITR", 2024, statement_dfs, batch_size=1) == 6
+        # Uma nova sincronização do mesmo período não duplica as linhas
+        assert crud.replace_period_statements(db, "ITR", 2024, statement_dfs, batch_size=3) == 6
+        result = crud.get_company_statements(db, OTHER_CNPJ, "ITR", 2024)
+
+    assert list(result) == ["BPA"]
+    assert result["BPA"]["CD_CONTA"].tolist() == ["1", "1.01", "1.01.01"]
+    assert result["BPA"]["VL_CONTA"].iloc[0] == 100.5
+
+def test_get_company_statements_for_unknown_period_is_empty(session_factory):
+    with session_factory() as db:
+        assert crud.get_company_statements(db, CNPJ, "ITR", 2030) == {}
+
+def test_create_report_with_existing_hash_returns_stored_report(session_factory):
+    fields = dict(cnpj=CNPJ, doc_type="ITR", year=2024, input_hash="abc", report="texto", financial_summary={"Ativo Total": 1.0})
+
+    with session_factory() as first, session_factory() as second:
+        stored = crud.create_report(first, **fields)
+        # Simula uma requisição concorrente que não viu o relatório antes de inserir
+        duplicate = crud.create_report(second, **{**fields, "report": "outro texto"})
+
+    assert duplicate.id == stored.id
+    assert duplicate.report == "texto"
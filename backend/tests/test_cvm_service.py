@@ -0,0 +1,90 @@
+import zipfile
+from collections import Counter
+from io import BytesIO
+import pytest
+from app.services import cvm_service
+
+@pytest.fixture
+def access_counter(monkeypatch):
+    counter = Counter()
+    monkeypatch.setattr(cvm_service, "_period_access_counter", counter)
+    return counter
+
+def test_access_stats_round_trip_without_leftover_files(access_counter, tmp_path):
+    path = tmp_path / "stats" / "access_stats.json"
+    access_counter.update({("ITR", 2024): 3, ("FRE", 2023): 1})
+
+    cvm_service.save_access_stats(str(path))
+    access_counter.clear()
+    cvm_service.load_access_stats(str(path))
+
+    assert access_counter == Counter({("ITR", 2024): 3, ("FRE", 2023): 1})
+    assert cvm_service.get_most_requested_periods(1) == [("ITR", 2024)]
+    assert [p.name for p in path.parent.iterdir()] == ["access_stats.json"]
+
+LISTING_HTML = '<pre><a href="itr_cia_aberta_2023.zip">a</a><a href="itr_cia_aberta_2024.zip">b</a><a href="leiame.txt">c</a></pre>'
+
+def test_zip_listing_is_cached_until_ttl_expires(monkeypatch):
+    now = [1000.0]
+    fetches = []
+    monkeypatch.setattr(cvm_service, "_zip_listing_cache", {})
+    monkeypatch.setattr(cvm_service.time, "time", lambda: now[0])
+    monkeypatch.setattr(cvm_service.settings, "CVM_LISTING_CACHE_TTL_SECONDS", 60)
+    monkeypatch.setattr(cvm_service, "fetch_cvm_data", lambda endpoint: fetches.append(endpoint) or LISTING_HTML)
+
+    expected = ["itr_cia_aberta_2023.zip", "itr_cia_aberta_2024.zip"]
+    assert cvm_service.list_available_zip_files("ITR") == expected
+    now[0] += 59
+    assert cvm_service.list_available_zip_files("itr") == expected
+    assert len(fetches) == 1
+
+    now[0] += 2
+    assert cvm_service.list_available_zip_files("ITR") == expected
+    assert len(fetches) == 2
+
+def _write_statement_csvs(year_path, statements, year=2024):
+    year_path.mkdir(parents=True)
+    for stmt_key in statements:
+        csv_name = cvm_service.STATEMENT_FILES_MAP[stmt_key].format(doc_type="itr", year=year)
+        (year_path / csv_name).write_text(
+            "CNPJ_CIA;CD_CONTA;VL_CONTA\n33.592.510/0001-54;1;2\n33.000.167/0001-01;1;1\n", encoding="latin-1"
+        )
+
+def test_load_statement_table_keeps_least_recently_used_tables_out(monkeypatch, tmp_path):
+    _write_statement_csvs(tmp_path / "ITR" / "2024", ["BPA", "BPP", "DRE"])
+    monkeypatch.setattr(cvm_service, "DEFAULT_DOWNLOAD_PATH", str(tmp_path))
+    monkeypatch.setattr(cvm_service, "_statements_cache", cvm_service.OrderedDict())
+    monkeypatch.setattr(cvm_service.settings, "STATEMENTS_CACHE_MAX_TABLES", 2)
+    reads = []
+    read_cvm_csv = cvm_service.read_cvm_csv
+    monkeypatch.setattr(cvm_service, "read_cvm_csv", lambda path: reads.append(path) or read_cvm_csv(path))
+
+    bpa = cvm_service.load_statement_table("ITR", 2024, "BPA")
+    cvm_service.load_statement_table("ITR", 2024, "BPP")
+    assert cvm_service.load_statement_table("ITR", 2024, "BPA") is bpa
+    cvm_service.load_statement_table("ITR", 2024, "DRE")
+
+    # BPA foi usada por último antes da DRE: a BPP é a descartada
+    assert list(cvm_service._statements_cache) == [("ITR", 2024, "BPA"), ("ITR", 2024, "DRE")]
+    assert len(reads) == 3
+    # Tabela indexada e ordenada por CNPJ
+    assert list(bpa.index) == ["33.000.167/0001-01", "33.592.510/0001-54"]
+
+def test_download_invalidates_cached_tables_of_the_period(monkeypatch, tmp_path):
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as zf:
+        zf.writestr("itr_cia_aberta_BPA_con_2024.csv", "CNPJ_CIA;CD_CONTA\n")
+    monkeypatch.setattr(cvm_service, "download_cvm_file", lambda segment: zip_buffer.getvalue())
+    scheduled = []
+    monkeypatch.setattr(cvm_service, "schedule_ingestion", lambda *args: scheduled.append(args))
+    monkeypatch.setattr(cvm_service, "_statements_cache", cvm_service.OrderedDict([
+        (("ITR", 2024, "BPA"), object()),
+        (("ITR", 2024, "DRE"), object()),
+        (("ITR", 2023, "BPA"), object()),
+    ]))
+
+    path = cvm_service.download_and_unzip_cvm_file("ITR", "itr_cia_aberta_2024.zip", str(tmp_path))
+
+    assert list(cvm_service._statements_cache) == [("ITR", 2023, "BPA")]
+    assert scheduled == [("ITR", 2024, path)]
+    assert (tmp_path / "ITR" / "2024" / "itr_cia_aberta_BPA_con_2024.csv").exists()
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from app.api.v1.endpoints import reports
+from app.main import app
+from app.services import ai_service
+
+REQUEST = {"cnpj": "33.000.167/0001-01", "year": 2024, "doc_type": "ITR"}
+SUMMARY = {"Ativo Total": 3}
+
+@pytest.fixture
+def client(monkeypatch, session_factory):
+    statements = {"DRE": pd.DataFrame({
+        "CD_CONTA": ["3.01"], "DS_CONTA": ["Receita"], "VL_CONTA": [10.0], "VERSAO": [1], "DT_FIM_EXERC": ["2024-09-30"],
+    })}
+    monkeypatch.setattr(reports, "SessionLocal", session_factory)
+    monkeypatch.setattr(reports.cvm_service, "get_financial_statements", lambda **kwargs: statements)
+    monkeypatch.setattr(reports, "_get_peer_context", lambda request: None)
+    # Sem eventos de startup: o banco de teste já é criado pela fixture
+    return TestClient(app)
+
+def _assert_no_connection_checked_out(session_factory):
+    assert session_factory.kw["bind"].pool.checkedout() == 0
+
+def test_generate_does_not_hold_a_connection_during_the_ai_call(monkeypatch, client, session_factory):
+    calls = []
+
+    def fake_analysis(financial_data, peer_context=None):
+        _assert_no_connection_checked_out(session_factory)
+        calls.append(1)
+        return {"report": "Texto.", "financial_summary": SUMMARY}
+
+    monkeypatch.setattr(ai_service, "generate_financial_analysis", fake_analysis)
+
+    first = client.post("/api/v1/reports/generate", json=REQUEST).json()
+    second = client.post("/api/v1/reports/generate", json=REQUEST).json()
+
+    assert first["cached"] is False and second["cached"] is True
+    assert second["report_id"] == first["report_id"]
+    assert first["financial_summary"]["Ativo Total"] == 3.0
+    assert len(calls) == 1
+
+def test_stream_does_not_hold_a_connection_during_the_ai_call(monkeypatch, client, session_factory):
+    def fake_stream(financial_data_json, peer_context=None):
+        _assert_no_connection_checked_out(session_factory)
+        yield "report_chunk", "Texto."
+        _assert_no_connection_checked_out(session_factory)
+        yield "financial_summary", ai_service.validate_financial_summary(SUMMARY)
+
+    monkeypatch.setattr(ai_service, "stream_financial_analysis", fake_stream)
+
+    body = client.post("/api/v1/reports/generate/stream", json=REQUEST).text
+    cached_body = client.post("/api/v1/reports/generate/stream", json=REQUEST).text
+
+    assert 'event: done\ndata: {"report_id": 1, "cached": false}' in body
+    assert 'event: done\ndata: {"report_id": 1, "cached": true}' in cached_body
@@ -0,0 +1,18 @@
+from collections import Counter
+from app.services import cvm_service, warmup_service
+
+def test_parse_targets_ignores_invalid_entries():
+    targets = ["ITR:2024", " fre:2023 ", "DFP:2024", "ITR:abc", "ITR"]
+
+    assert warmup_service._parse_targets(targets) == [("ITR", 2024), ("FRE", 2023)]
+
+def test_select_periods_adds_most_requested_without_repeating(monkeypatch):
+    monkeypatch.setattr(warmup_service.settings, "WARMUP_TARGETS", ["ITR:2024"])
+    monkeypatch.setattr(warmup_service.settings, "WARMUP_TOP_PERIODS", 2)
+    monkeypatch.setattr(cvm_service, "_period_access_counter", Counter({
+        ("ITR", 2024): 5,
+        ("FRE", 2022): 3,
+        ("ITR", 2020): 1,
+    }))
+
+    assert warmup_service.select_periods() == [("ITR", 2024), ("FRE", 2022)]